@@ -1,21 +1,57 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, g, render_template, jsonify, request
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 import time
 from datetime import datetime, timezone
 import threading
-from collections import defaultdict, deque
 import atexit
 import json
 import os
 import hashlib
 import re
+import signal
+import tempfile
+
+from eventlog import EventLog
+from ingest import MAX_BODY_BYTES, IngestError, decode_batch, is_bulk
+from metrics import Registry, TimedLock, lock_totals
+from monitor import ConnectionFeed
+from profiler import SamplingProfiler, install_signal_toggle
+from rules import RuleEngine
+from stats import GlobalStats
+from store import create_store
+from stream import SessionNotifier, event_stream
 
 app = Flask(__name__)
+# Werkzeug refuses larger bodies (including chunked ones) before buffering them
+app.config["MAX_CONTENT_LENGTH"] = MAX_BODY_BYTES
 CORS(app)
 
-# Store events from browser sessions
-app.session_events = defaultdict(lambda: deque(maxlen=1000))  # session_id -> events
-app._events_lock = threading.Lock()
+# Prometheus metrics at /metrics; METRICS=0 removes the per-request hooks and lock timing
+METRICS_ENABLED = os.environ.get("METRICS", "1") != "0"
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "privacy-scanner-profiles"))
+
+# Store events from browser sessions; EVENT_STORE=sqlite shares it across gunicorn workers
+app.event_store = create_store(lock_factory=TimedLock if METRICS_ENABLED else threading.Lock)
+
+# Cross-session analytics, fed by the event log's writer thread. With
+# EVENT_LOG_DIR set, accepted events are also appended to compressed JSONL
+# segments there, the analytics are rebuilt from them at startup, and each
+# worker follows the other workers' segments so the analytics cover all of them.
+app.global_stats = GlobalStats()
+app.event_log = EventLog(
+    os.environ.get("EVENT_LOG_DIR") or None,
+    listeners=[app.global_stats.observe],
+    segment_bytes=int(float(os.environ.get("EVENT_LOG_SEGMENT_MB", 64)) * 1024 * 1024),
+    max_segments=int(os.environ.get("EVENT_LOG_MAX_SEGMENTS", 100)),
+    max_queued_events=int(os.environ.get("EVENT_LOG_MAX_QUEUED", 100000)),
+    fsync=os.environ.get("EVENT_LOG_FSYNC", "1") != "0",
+)
+atexit.register(app.event_log.close)
+
+# Server-Sent Events: wakes /api/stream generators when their session gets events
+app.stream_notifier = SessionNotifier()
+app.stream_slots = threading.BoundedSemaphore(int(os.environ.get("STREAM_MAX_CONNECTIONS", 32)))
 
 # Trust configuration for domain classification
 TRUST_CONFIG = {
@@ -32,24 +68,22 @@ TRUST_CONFIG = {
     ]
 }
 
+def _rule_files(env_var):
+    return [p for p in os.environ.get(env_var, "").split(os.pathsep) if p]
+
+# Compiled matcher for TRUST_CONFIG plus optional blocklist/allowlist files
+# (hosts files, adblock "||domain^" lists); files hot-reload on change.
+rule_engine = RuleEngine(
+    trusted=TRUST_CONFIG["trusted"],
+    risky=TRUST_CONFIG["risky"],
+    trusted_files=_rule_files("TRUSTED_RULES_FILES"),
+    risky_files=_rule_files("RISKY_RULES_FILES"),
+    cache_size=int(os.environ.get("VERDICT_CACHE_SIZE", 65536)),
+)
+
 def classify_domain(domain):
     """Classify domain as Safe/Risk/Caution"""
-    if not domain:
-        return "Caution"
-    
-    domain_lower = domain.lower()
-    
-    # Check trusted patterns
-    for pattern in TRUST_CONFIG["trusted"]:
-        if pattern in domain_lower:
-            return "Safe"
-    
-    # Check risky patterns  
-    for pattern in TRUST_CONFIG["risky"]:
-        if pattern in domain_lower:
-            return "Risk"
-    
-    return "Caution"
+    return rule_engine.classify(domain)
 
 def extract_domain(url):
     """Extract domain from URL"""
@@ -65,6 +99,109 @@ def extract_domain(url):
     except:
         return url
 
+# Each sample carries the worker pid; with METRICS_DIR shared by the workers, any worker serves all of them
+metrics = Registry(prefix="privacy_scanner_", pid_label="pid", directory=os.environ.get("METRICS_DIR") or None)
+if METRICS_ENABLED and metrics.directory is not None:
+    metrics.start_snapshots()
+REQUEST_LATENCY = metrics.histogram(
+    "http_request_duration_seconds", "Time to produce a response, by route", ("route", "method")
+)
+REQUESTS = metrics.counter("http_requests_total", "Responses sent, by route and status", ("route", "method", "status"))
+EVENTS_INGESTED = metrics.counter("events_ingested_total", "Events stored by /api/browser-events")
+EVENTS_REJECTED = metrics.counter("events_rejected_total", "Malformed events dropped from bulk batches")
+INGEST_ERRORS = metrics.counter("ingest_errors_total", "Unexpected errors in /api/browser-events")
+
+def _verdict_cache(field):
+    return lambda: getattr(rule_engine.cache_info(), field)
+
+def _verdict_cache_hit_ratio():
+    info = rule_engine.cache_info()
+    lookups = info.hits + info.misses
+    return info.hits / lookups if lookups else None
+
+def _store_locks(field):
+    def read():
+        totals = lock_totals(shard.lock for shard in getattr(app.event_store, "shards", []))
+        return totals[field] if totals else None
+    return read
+
+metrics.gauge_fn("verdict_cache_hits_total", "classify_domain cache hits", lambda: rule_engine.cache_totals()[0], kind="counter")
+metrics.gauge_fn("verdict_cache_misses_total", "classify_domain cache misses", lambda: rule_engine.cache_totals()[1], kind="counter")
+metrics.gauge_fn("verdict_cache_entries", "Domains in the verdict cache", _verdict_cache("currsize"))
+metrics.gauge_fn("verdict_cache_hit_ratio", "Hit ratio of the verdict cache since the last rule reload", _verdict_cache_hit_ratio)
+metrics.gauge_fn("event_store_sessions", "Live sessions in the event store", lambda: app.event_store.session_count)
+metrics.gauge_fn(
+    "event_store_bytes", "Estimated bytes held by stored events",
+    lambda: getattr(app.event_store, "nbytes", None),
+)
+metrics.gauge_fn(
+    "event_store_lock_acquisitions_total", "Event store lock acquisitions", _store_locks("acquisitions"), kind="counter"
+)
+metrics.gauge_fn(
+    "event_store_lock_contended_total", "Acquisitions that had to wait", _store_locks("contended"), kind="counter"
+)
+metrics.gauge_fn(
+    "event_store_lock_wait_seconds_total", "Time spent waiting for event store locks",
+    _store_locks("wait_seconds"), kind="counter",
+)
+metrics.gauge_fn(
+    "event_store_lock_hold_seconds_total", "Time event store locks were held",
+    _store_locks("hold_seconds"), kind="counter",
+)
+
+metrics.gauge_fn("event_log_written_total", "Events committed by the event log writer", lambda: app.event_log.written, kind="counter")
+metrics.gauge_fn("event_log_dropped_total", "Events dropped because the log queue was full", lambda: app.event_log.dropped, kind="counter")
+metrics.gauge_fn("event_log_commits_total", "Group commits by the event log writer", lambda: app.event_log.commits, kind="counter")
+
+@app.before_request
+def _before_request():
+    """Start the request timer and, in debug mode, a ?profile=1 profiler"""
+    if METRICS_ENABLED:
+        g.request_started = time.perf_counter()
+    if app.debug and request.args.get("profile") == "1":
+        g.profiler = SamplingProfiler(interval=0.001, thread_ids={threading.get_ident()}).start()
+
+@app.after_request
+def _after_request(response):
+    """Record route latency; attach the profile path if this request was profiled"""
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        REQUEST_LATENCY.observe(time.perf_counter() - started, (route, request.method))
+        REQUESTS.inc(1, (route, request.method, str(response.status_code)))
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        response.headers["X-Profile"] = profiler.stop().dump(PROFILE_DIR, label="request")
+    return response
+
+# kill -USR2 <pid> starts a whole-process sampling profile, a second signal writes it to PROFILE_DIR
+if os.environ.get("PROFILE_SIGNAL"):
+    try:
+        install_signal_toggle(getattr(signal, "SIG" + os.environ["PROFILE_SIGNAL"].upper()), PROFILE_DIR)
+    except (AttributeError, ValueError) as e:
+        print(f"⚠️ Could not install profiler signal {os.environ['PROFILE_SIGNAL']}: {e}")
+
+# Optional: record this machine's own outgoing connections as session
+# LOCAL_MONITOR_SESSION, with hostnames resolved off the request path
+LOCAL_MONITOR_SESSION = os.environ.get("LOCAL_MONITOR_SESSION", "local")
+
+def _store_local_connections(events):
+    """Classify ConnectionFeed events and append them to the local session"""
+    now = time.time()
+    for event in events:
+        event["server_timestamp"] = now
+        event["verdict"] = classify_domain(event["domain"])
+        event["session_id"] = LOCAL_MONITOR_SESSION
+        event["type"] = "os_connection"
+    app.event_store.append(LOCAL_MONITOR_SESSION, events)
+    app.event_log.append(LOCAL_MONITOR_SESSION, events)
+    app.stream_notifier.notify(LOCAL_MONITOR_SESSION)
+
+if os.environ.get("LOCAL_MONITOR_INTERVAL"):
+    app.connection_feed = ConnectionFeed(
+        _store_local_connections, interval=float(os.environ["LOCAL_MONITOR_INTERVAL"])
+    ).start()
+
 @app.route("/")
 def index():
     return render_template("index.html")
@@ -79,44 +216,85 @@ def api_events():
         n = 50
     n = max(1, min(n, 500))
     
-    with app._events_lock:
-        events = list(app.session_events.get(session_id, []))[-n:]
+    since = request.args.get("since")
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({"error": "Invalid since"}), 400
+        # Only events newer than the client's cursor, newest first
+        events, last_seq, truncated = app.event_store.events_since(session_id, since)
+        return jsonify({"events": events, "count": len(events), "last_seq": last_seq, "truncated": truncated})
     
-    events.reverse()  # Show newest first
-    return jsonify({"events": events, "count": len(events)})
+    events = app.event_store.recent(session_id, n)  # Newest first
+    last_seq = events[0]["seq"] if events else app.event_store.last_seq(session_id)
+    return jsonify({"events": events, "count": len(events), "last_seq": last_seq})
+
+def _classify_events(events, session_id):
+    """Add server fields and a verdict to client events (runs outside any store lock)"""
+    now = time.time()
+    for event in events:
+        # Add server timestamp and classification
+        event["server_timestamp"] = now
+        event["timestamp"] = event.get("timestamp", now)
+        
+        # Extract domain and classify
+        url = event.get("url", "")
+        domain = extract_domain(url)
+        event["domain"] = domain
+        event["verdict"] = classify_domain(domain)
+        
+        # Add session info
+        event["session_id"] = session_id
+        event["type"] = "browser_request"
+    return events
 
 @app.route("/api/browser-events", methods=["POST"])
 def receive_browser_events():
-    """Receive network events from browser"""
+    """Receive network events from browser (JSON, or bulk NDJSON/msgpack, optionally gzip'd)"""
+    # Reject oversized batches from the header alone, before reading any of the body
+    if request.content_length is not None and request.content_length > MAX_BODY_BYTES:
+        return jsonify({"error": "Payload too large"}), 413
     try:
-        data = request.get_json()
-        if not data or "events" not in data:
-            return jsonify({"error": "Invalid payload"}), 400
-        
-        session_id = data.get("session_id", "default")
-        events = data.get("events", [])
+        content_encoding = request.headers.get("Content-Encoding", "").lower()
+        # sendBeacon can only send text/plain, so it names the format in the query string
+        mimetype = "application/x-ndjson" if request.args.get("format") == "ndjson" else request.mimetype
+        if is_bulk(mimetype, content_encoding):
+            try:
+                body_session_id, events, rejected = decode_batch(
+                    request.get_data(cache=False), mimetype, content_encoding
+                )
+            except IngestError as e:
+                return jsonify({"error": e.message}), e.status
+            session_id = request.args.get("session_id") or body_session_id or "default"
+        else:
+            data = request.get_json()
+            if not data or "events" not in data:
+                return jsonify({"error": "Invalid payload"}), 400
+            
+            session_id = data.get("session_id", "default")
+            events = data.get("events", [])
+            rejected = 0
         
-        with app._events_lock:
-            for event in events:
-                # Add server timestamp and classification
-                event["server_timestamp"] = time.time()
-                event["timestamp"] = event.get("timestamp", time.time())
-                
-                # Extract domain and classify
-                url = event.get("url", "")
-                domain = extract_domain(url)
-                event["domain"] = domain
-                event["verdict"] = classify_domain(domain)
-                
-                # Add session info
-                event["session_id"] = session_id
-                event["type"] = "browser_request"
-                
-                app.session_events[session_id].append(event)
+        # Parse and classify first; the store takes its lock once for the whole batch
+        _classify_events(events, session_id)
+        app.event_store.append(session_id, events)
+        app.event_log.append(session_id, events)  # queued; written and aggregated off the request path
+        app.stream_notifier.notify(session_id)
+        EVENTS_INGESTED.inc(len(events))
+        if rejected:
+            EVENTS_REJECTED.inc(rejected)
         
-        return jsonify({"status": "success", "received": len(events)})
+        response = {"status": "success", "received": len(events)}
+        if rejected:
+            response["rejected"] = rejected
+        return jsonify(response)
         
+    except RequestEntityTooLarge:
+        # A chunked body ran past MAX_CONTENT_LENGTH while being read
+        return jsonify({"error": "Payload too large"}), 413
     except Exception as e:
+        INGEST_ERRORS.inc()
         print(f"❌ Error receiving browser events: {e}")
         return jsonify({"error": "Server error"}), 500
 
@@ -125,19 +303,52 @@ def api_session_stats():
     """Get statistics for current session"""
     session_id = request.args.get("session_id", "default")
     
-    with app._events_lock:
-        events = list(app.session_events.get(session_id, []))
+    return jsonify(app.event_store.stats(session_id))
+
+@app.route("/api/global-stats")
+def api_global_stats():
+    """Cross-session verdict rates, unique domains and top risky domains"""
+    try:
+        top = int(request.args.get("top", 20))
+    except ValueError:
+        top = 20
+    top = max(1, min(top, 200))
+    
+    payload = app.global_stats.as_dict(top=top)
+    payload["log"] = app.event_log.info()
+    return jsonify(payload)
+
+@app.route("/api/stream")
+def api_stream():
+    """Push new events and stats deltas for a session as Server-Sent Events"""
+    session_id = request.args.get("session_id", "default")
+    try:
+        cursor = int(request.headers.get("Last-Event-ID") or request.args.get("since", -1))
+    except ValueError:
+        return jsonify({"error": "Invalid since"}), 400
     
-    stats = {
-        "total_requests": len(events),
-        "safe_count": sum(1 for e in events if e.get("verdict") == "Safe"),
-        "risk_count": sum(1 for e in events if e.get("verdict") == "Risk"),
-        "caution_count": sum(1 for e in events if e.get("verdict") == "Caution"),
-        "unique_domains": len(set(e.get("domain", "") for e in events if e.get("domain"))),
-        "last_activity": max((e.get("timestamp", 0) for e in events), default=0)
-    }
+    # A sync worker has a single thread: one open stream would block every other request
+    if not request.environ.get("wsgi.multithread"):
+        return jsonify({"error": "Streaming needs a threaded worker"}), 503
     
-    return jsonify(stats)
+    # Each open stream holds a worker thread; refuse rather than queue past the cap
+    if not app.stream_slots.acquire(blocking=False):
+        return jsonify({"error": "Too many streams"}), 503, {"Retry-After": "5"}
+    
+    response = Response(
+        event_stream(app.event_store, app.stream_notifier, session_id, cursor),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    response.call_on_close(app.stream_slots.release)
+    return response
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Prometheus text exposition of request, ingest, cache and store metrics"""
+    if not METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     print("🌐 Privacy Scanner - Global Web App")
@@ -0,0 +1,54 @@
+import http.client
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_gunicorn(
+    workers: int,
+    port: int,
+    env: Optional[Dict[str, str]] = None,
+    extra_args: tuple = (),
+    timeout: float = 30.0,
+) -> subprocess.Popen:
+    """Start ``gunicorn app:app`` from the repo root and wait until it answers."""
+    proc_env = dict(os.environ)
+    proc_env.update(env or {})
+    proc = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn", "app:app",
+            "--workers", str(workers),
+            "--bind", f"127.0.0.1:{port}",
+            "--log-level", "warning",
+            *extra_args,
+        ],
+        cwd=REPO_ROOT,
+        env=proc_env,
+    )
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/api/session-stats?session_id=__ready__")
+            conn.getresponse().read()
+            conn.close()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    stop_gunicorn(proc)
+    raise RuntimeError("gunicorn did not become ready in time")
+
+
+def stop_gunicorn(proc: subprocess.Popen) -> None:
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
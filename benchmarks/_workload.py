@@ -0,0 +1,74 @@
+import json
+import os
+import random
+import string
+from typing import Dict, List, Tuple
+
+# Shapes of traffic the dashboard sees: mostly well-known sites, a share of
+# ad/tracker hosts, and a long tail of one-off domains.
+TRUSTED_SITES = ["google.com", "gstatic.com", "github.com", "microsoft.com", "cloudflare.com", "youtube.com"]
+RISKY_SITES = ["doubleclick.net", "googlesyndication.com", "adnxs.com", "tracking.example", "pixel.example"]
+PATHS = ["/", "/index.html", "/api/v1/items?page=2", "/static/app.js", "/collect?v=1&tid=UA-1", "/img/logo.png"]
+
+
+def _label(rng: random.Random, n: int) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(n))
+
+
+class Workload:
+    """
+    Deterministic synthetic traffic for the benchmarks.
+
+    Domains are drawn with Zipf-like popularity from a mix of trusted sites,
+    risky sites, hosts on the generated rule lists and a long tail of unknown
+    domains, so verdict-cache hit rates resemble real browsing rather than
+    one domain repeated or every domain unique.
+    """
+
+    def __init__(self, seed: int = 0, unique_domains: int = 5000, rule_domains: int = 50000) -> None:
+        self.rng = random.Random(seed)
+        rng = self.rng
+        self.rule_domains = [f"{_label(rng, 8)}.{_label(rng, 5)}.{rng.choice(['com', 'net', 'io'])}" for _ in range(rule_domains)]
+        pool = []
+        for i in range(unique_domains):
+            kind = i % 10
+            if kind < 4:
+                pool.append(f"{_label(rng, 4)}.{rng.choice(TRUSTED_SITES)}")
+            elif kind < 6:
+                pool.append(f"{_label(rng, 3)}.{rng.choice(RISKY_SITES)}")
+            elif kind < 7 and self.rule_domains:
+                pool.append(rng.choice(self.rule_domains))
+            else:
+                pool.append(f"{_label(rng, 6)}.{_label(rng, 7)}.org")
+        rng.shuffle(pool)
+        self.domains = pool
+        self._weights = [1.0 / (rank + 1) for rank in range(len(pool))]
+
+    def domain(self) -> str:
+        return self.rng.choices(self.domains, self._weights)[0]
+
+    def url(self) -> str:
+        return f"https://{self.domain()}{self.rng.choice(PATHS)}"
+
+    def events(self, count: int) -> List[Dict]:
+        return [
+            {"url": self.url(), "method": self.rng.choice(["GET", "GET", "POST"]), "status": 200, "timestamp": 1.7e9 + i}
+            for i in range(count)
+        ]
+
+    def json_batch(self, session_id: str, count: int) -> bytes:
+        return json.dumps({"session_id": session_id, "events": self.events(count)}).encode()
+
+    def ndjson_batch(self, session_id: str, count: int) -> bytes:
+        lines = [json.dumps({"session_id": session_id})] + [json.dumps(e) for e in self.events(count)]
+        return "\n".join(lines).encode()
+
+    def write_rule_files(self, directory: str) -> Tuple[str, str]:
+        """A hosts-format blocklist of every rule domain and a small allowlist; returns (trusted, risky) paths."""
+        risky = os.path.join(directory, "risky.hosts")
+        trusted = os.path.join(directory, "trusted.txt")
+        with open(risky, "w") as fh:
+            fh.writelines(f"0.0.0.0 {d}\n" for d in self.rule_domains)
+        with open(trusted, "w") as fh:
+            fh.writelines(f"{d}\n" for d in self.rule_domains[: len(self.rule_domains) // 50])
+        return trusted, risky
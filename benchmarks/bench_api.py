@@ -0,0 +1,411 @@
+"""
+Repeatable benchmark suite for the Flask API and its hot helpers.
+
+Drives /api/browser-events (JSON and NDJSON), /api/events,
+/api/events?since= and /api/session-stats with a synthetic workload (many
+sessions, Zipf-distributed trusted/risky/unknown domains, large generated
+rule lists), once in-process through the Flask test client and once over
+HTTP against a local gunicorn. For each endpoint it reports requests/sec,
+p50/p99 latency and peak RSS; micro-benchmarks cover classify_domain,
+extract_domain and the capture/monitor event builders.
+
+Peak RSS is measured per endpoint where Linux lets the peak be reset
+(/proc/<pid>/clear_refs); elsewhere it is the process's peak so far, marked
+``"rss_scope": "cumulative"`` and not compared against a baseline.
+
+Results go to JSON; --baseline compares against an earlier run and exits 1
+if any metric regressed by more than --tolerance.
+
+    python benchmarks/bench_api.py --json results.json
+    python benchmarks/bench_api.py --mode inprocess --baseline results.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+
+from _server import start_gunicorn, stop_gunicorn  # noqa: E402
+from _workload import Workload  # noqa: E402
+
+# Metric name -> True when larger is better; used by the baseline comparison
+METRICS = {"requests_per_sec": True, "ops_per_sec": True, "p50_ms": False, "p99_ms": False, "peak_rss_mb": False}
+
+Request = Tuple[str, str, Optional[bytes], Dict[str, str]]
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _summarize(
+    latencies: List[float], elapsed: float, errors: int, peak_rss_mb: Optional[float], rss_scope: str
+) -> Dict:
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "requests_per_sec": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+        "peak_rss_mb": peak_rss_mb,
+        "rss_scope": rss_scope,
+        "errors": errors,
+    }
+
+
+def _self_peak_rss_mb() -> float:
+    """Peak RSS of this process since it started (ru_maxrss cannot be reset)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _reset_peak_rss(pids: List[int]) -> bool:
+    """Reset VmHWM to the current RSS for ``pids``; False where unsupported (not Linux, no permission)."""
+    try:
+        for pid in pids:
+            with open(f"/proc/{pid}/clear_refs", "w") as fh:
+                fh.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def _tree_pids(root_pid: int) -> List[int]:
+    """``root_pid`` and its children (gunicorn master + workers); Linux only."""
+    pids = [root_pid]
+    try:
+        for entry in os.listdir("/proc"):
+            if entry.isdigit():
+                with open(f"/proc/{entry}/stat") as fh:
+                    stat = fh.read()
+                if int(stat[stat.rindex(")") + 2 :].split()[1]) == root_pid:
+                    pids.append(int(entry))
+    except OSError:
+        pass
+    return pids
+
+
+def _peak_rss_mb(pids: List[int]) -> Optional[float]:
+    """Largest VmHWM among ``pids``; Linux only."""
+    peak = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as fh:
+                for line in fh:
+                    if line.startswith("VmHWM:"):
+                        peak = max(peak, int(line.split()[1]))
+        except OSError:
+            continue
+    return round(peak / 1024, 1) if peak else None
+
+
+def scenarios(workload: Workload, sessions: int, batch: int) -> Dict[str, Callable[[int], Request]]:
+    """Endpoint name -> factory building the i-th request (method, path, body, headers)."""
+    session_ids = [f"bench_{i}" for i in range(sessions)]
+    json_headers = {"Content-Type": "application/json"}
+    ndjson_headers = {"Content-Type": "application/x-ndjson"}
+    return {
+        "ingest_json": lambda i: (
+            "POST", "/api/browser-events", workload.json_batch(session_ids[i % sessions], batch), json_headers
+        ),
+        "ingest_ndjson": lambda i: (
+            "POST", "/api/browser-events", workload.ndjson_batch(session_ids[i % sessions], batch), ndjson_headers
+        ),
+        "events": lambda i: ("GET", f"/api/events?session_id={session_ids[i % sessions]}&n=50", None, {}),
+        "events_since": lambda i: ("GET", f"/api/events?session_id={session_ids[i % sessions]}&since=0", None, {}),
+        "session_stats": lambda i: ("GET", f"/api/session-stats?session_id={session_ids[i % sessions]}", None, {}),
+    }
+
+
+def run_inprocess(workload: Workload, args: argparse.Namespace, env: Dict[str, str]) -> Dict[str, Dict]:
+    # The rule engine and store are built at import time, so configure first
+    os.environ.update(env)
+    import app as app_module
+
+    client = app_module.app.test_client()
+    results = {}
+    for name, build in scenarios(workload, args.sessions, args.batch).items():
+        requests = [build(i) for i in range(args.warmup + args.requests)]
+        for method, path, body, headers in requests[: args.warmup]:
+            client.open(path, method=method, data=body, headers=headers)
+        per_endpoint = _reset_peak_rss([os.getpid()])
+        latencies = []
+        errors = 0
+        started = time.perf_counter()
+        for method, path, body, headers in requests[args.warmup :]:
+            t0 = time.perf_counter()
+            resp = client.open(path, method=method, data=body, headers=headers)
+            latencies.append(time.perf_counter() - t0)
+            if resp.status_code != 200:
+                errors += 1
+        elapsed = time.perf_counter() - started
+        if per_endpoint:
+            results[name] = _summarize(latencies, elapsed, errors, _peak_rss_mb([os.getpid()]), "endpoint")
+        else:
+            results[name] = _summarize(latencies, elapsed, errors, _self_peak_rss_mb(), "cumulative")
+    return results
+
+
+def _http_client(port: int, requests: List[Request], latencies: List[float], errors: List[int]) -> None:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    for method, path, body, headers in requests:
+        t0 = time.perf_counter()
+        try:
+            conn.request(method, path, body, headers)
+            resp = conn.getresponse()
+            resp.read()
+            ok = resp.status == 200
+        except (OSError, http.client.HTTPException):
+            ok = False
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        latencies.append(time.perf_counter() - t0)
+        if not ok:
+            errors.append(1)
+    conn.close()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_gunicorn(workload: Workload, args: argparse.Namespace, env: Dict[str, str]) -> Dict[str, Dict]:
+    port = args.port or _free_port()
+    extra = ("--worker-class", "gthread", "--threads", str(args.threads))
+    proc = start_gunicorn(args.workers, port, env=env, extra_args=extra)
+    results = {}
+    try:
+        for name, build in scenarios(workload, args.sessions, args.batch).items():
+            warm_latencies: List[float] = []
+            _http_client(port, [build(i) for i in range(args.warmup)], warm_latencies, [])
+            # Bodies are built up front so client-side JSON encoding is not timed
+            per_client = [
+                [build(c + k * args.clients) for k in range(args.requests // args.clients)] for c in range(args.clients)
+            ]
+            pids = _tree_pids(proc.pid)
+            rss_scope = "endpoint" if _reset_peak_rss(pids) else "cumulative"
+            latencies: List[float] = []
+            errors: List[int] = []
+            threads = [
+                threading.Thread(target=_http_client, args=(port, reqs, latencies, errors)) for reqs in per_client
+            ]
+            started = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - started
+            results[name] = _summarize(latencies, elapsed, len(errors), _peak_rss_mb(pids), rss_scope)
+    finally:
+        stop_gunicorn(proc)
+    return results
+
+
+def _micro(fn: Callable[[], None], inner: int, min_seconds: float) -> Dict:
+    rounds = 0
+    started = time.perf_counter()
+    while True:
+        fn()
+        rounds += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            break
+    ops = rounds * inner
+    return {"ops": ops, "ops_per_sec": round(ops / elapsed, 1), "ns_per_op": round(elapsed / ops * 1e9, 1)}
+
+
+def run_micro(workload: Workload, args: argparse.Namespace, env: Dict[str, str]) -> Dict[str, Dict]:
+    os.environ.update(env)
+    import app as app_module
+    import capture
+    import monitor
+
+    domains = [workload.domain() for _ in range(10000)]
+    urls = [workload.url() for _ in range(10000)]
+    engine = app_module.rule_engine
+    results = {}
+
+    def classify_warm():
+        for d in domains:
+            app_module.classify_domain(d)
+
+    def classify_uncached():
+        classify = engine.ruleset.classify
+        for d in domains:
+            classify(d)
+
+    def extract():
+        for u in urls:
+            app_module.extract_domain(u)
+
+    def classify_batch():
+        app_module._classify_events([{"url": u} for u in urls[:1000]], "bench")
+
+    results["classify_domain"] = _micro(classify_warm, len(domains), args.micro_seconds)
+    results["classify_domain_uncached"] = _micro(classify_uncached, len(domains), args.micro_seconds)
+    results["extract_domain"] = _micro(extract, len(urls), args.micro_seconds)
+    results["classify_events_batch"] = _micro(classify_batch, 1000, args.micro_seconds)
+
+    if capture.IP is not None:
+        from scapy.all import Ether, IP, TCP, Raw  # type: ignore
+
+        packets = [
+            Ether(src="00:00:00:00:00:01", dst="00:00:00:00:00:02")
+            / IP(dst=f"10.0.{i % 256}.{i % 250 + 1}")
+            / TCP(dport=443 if i % 3 else 80)
+            / Raw(b"GET / HTTP/1.1\r\nHost: example.org\r\n\r\n" if i % 3 == 0 else b"\0" * 64)
+            for i in range(1000)
+        ]
+
+        def packet_events():
+            for pkt in packets:
+                capture._packet_to_event(pkt)
+
+        results["capture_packet_to_event"] = _micro(packet_events, len(packets), args.micro_seconds)
+
+    net_tcp = os.path.join("/proc", "net", "tcp")
+    if os.path.exists(net_tcp):
+        tracker = monitor.ConnectionTracker()
+        tracker.sample()
+        results["monitor_tracker_sample"] = _micro(tracker.sample, 1, args.micro_seconds)
+        results["monitor_read_proc_net_tcp"] = _micro(
+            lambda: monitor._read_proc_net_tcp("/proc"), 1, args.micro_seconds
+        )
+    return results
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Human-readable regressions of ``current`` against ``baseline`` beyond ``tolerance`` (a fraction)."""
+    regressions = []
+    for group, rows in current.get("results", {}).items():
+        for name, row in rows.items():
+            base_row = baseline.get("results", {}).get(group, {}).get(name)
+            if not base_row:
+                continue
+            for metric, higher_is_better in METRICS.items():
+                new, old = row.get(metric), base_row.get(metric)
+                if not new or not old:
+                    continue
+                # A cumulative peak depends on what ran before, so it is only compared per endpoint
+                if metric == "peak_rss_mb" and not row.get("rss_scope") == base_row.get("rss_scope") == "endpoint":
+                    continue
+                change = (new - old) / old
+                if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                    regressions.append(f"{group}.{name}.{metric}: {old} -> {new} ({change:+.1%})")
+    return regressions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _print_rows(group: str, rows: Dict[str, Dict]) -> None:
+    print(f"[{group}]")
+    for name, row in rows.items():
+        if "requests_per_sec" in row:
+            print(
+                f"  {name:<26} {row['requests_per_sec']:>9} req/s  p50 {row['p50_ms']:>8} ms  "
+                f"p99 {row['p99_ms']:>8} ms  rss {row['peak_rss_mb']} MB"
+                f"{'' if row.get('rss_scope') == 'endpoint' else ' (cumulative)'}  errors={row['errors']}"
+            )
+        else:
+            print(f"  {name:<26} {row['ops_per_sec']:>12} ops/s  {row['ns_per_op']:>10} ns/op")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mode", default="all", choices=["all", "inprocess", "gunicorn", "micro"])
+    parser.add_argument("--requests", type=int, default=2000, help="timed requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--batch", type=int, default=20, help="events per ingest request")
+    parser.add_argument("--unique-domains", type=int, default=5000)
+    parser.add_argument("--rule-domains", type=int, default=50000, help="size of the generated blocklist")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent HTTP clients against gunicorn")
+    parser.add_argument(
+        "--store", choices=["memory", "sqlite"],
+        help="event store (default: sqlite for gunicorn with --workers > 1, else memory)",
+    )
+    parser.add_argument("--port", type=int, default=0, help="gunicorn port (default: a free one)")
+    parser.add_argument("--micro-seconds", type=float, default=1.0, help="minimum run time per micro-benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="write results to this file")
+    parser.add_argument("--baseline", help="compare against this earlier --json output")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression as a fraction")
+    args = parser.parse_args()
+
+    workload = Workload(args.seed, args.unique_domains, args.rule_domains)
+    workdir = tempfile.mkdtemp(prefix="bench-api-")
+    trusted_rules, risky_rules = workload.write_rule_files(workdir)
+    # Several workers on the per-process memory store would each see a fraction of the sessions
+    stores = {
+        "inprocess": args.store or "memory",
+        "gunicorn": args.store or ("sqlite" if args.workers > 1 else "memory"),
+        "micro": args.store or "memory",
+    }
+    envs = {}
+    for group, store in stores.items():
+        envs[group] = {"EVENT_STORE": store, "TRUSTED_RULES_FILES": trusted_rules, "RISKY_RULES_FILES": risky_rules}
+        if store == "sqlite":
+            envs[group]["EVENT_STORE_PATH"] = os.path.join(workdir, f"events-{group}.db")
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("json_path", "baseline")},
+            "stores": {group: store for group, store in stores.items() if args.mode in ("all", group)},
+        },
+        "results": {},
+    }
+    # In-process first: where the peak RSS cannot be reset it is the whole process's, so nothing else should have run yet
+    runners = [("inprocess", run_inprocess), ("gunicorn", run_gunicorn), ("micro", run_micro)]
+    for group, runner in runners:
+        if args.mode in ("all", group):
+            report["results"][group] = runner(workload, args, envs[group])
+            _print_rows(group, report["results"][group])
+
+    if args.json_path:
+        with open(args.json_path, "w") as fh:
+            json.dump(report, fh, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            regressions = compare(report, json.load(fh), args.tolerance)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
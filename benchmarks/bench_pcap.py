@@ -0,0 +1,90 @@
+"""
+Packets/sec of the scapy replay path versus the raw-header decoder.
+
+Without --pcap a synthetic Ethernet/IPv4/TCP capture is written (directly
+with struct, so generating it does not need scapy).
+
+    python benchmarks/bench_pcap.py --packets 200000
+    python benchmarks/bench_pcap.py --pcap big.pcap --skip-scapy
+"""
+import argparse
+import json
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import capture  # noqa: E402
+import pcapdecode  # noqa: E402
+
+
+def write_synthetic_pcap(path, packets, seed=0):
+    rng = random.Random(seed)
+    ports = [443, 443, 80, 22, 53]
+    with open(path, "wb") as fh:
+        fh.write(struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1))
+        for i in range(packets):
+            payload = b"\0" * rng.randrange(0, 1200)
+            tcp = struct.pack("!HHIIBBHHH", 50000 + i % 1000, rng.choice(ports), i, 0, 0x50, 0x18, 65535, 0, 0)
+            total_len = 20 + len(tcp) + len(payload)
+            dst = bytes([10, rng.randrange(4), rng.randrange(256), rng.randrange(1, 255)])
+            ip = struct.pack("!BBHHHBBH4s4s", 0x45, 0, total_len, i & 0xFFFF, 0, 64, 6, 0, bytes([192, 168, 1, 2]), dst)
+            eth = b"\x66\x77\x88\x99\xaa\xbb\x00\x11\x22\x33\x44\x55\x08\x00"
+            frame = eth + ip + tcp + payload
+            ts = 1_700_000_000 + i * 0.0005
+            fh.write(struct.pack("<IIII", int(ts), int((ts % 1) * 1e6), len(frame), len(frame)))
+            fh.write(frame)
+
+
+def _timed(label, packets, fn):
+    started = time.perf_counter()
+    selected = fn()
+    elapsed = time.perf_counter() - started
+    return {"path": label, "seconds": round(elapsed, 3), "packets_per_sec": round(packets / elapsed, 1), "selected": selected}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pcap", help="existing capture to decode")
+    parser.add_argument("--packets", type=int, default=100000, help="size of the synthetic capture")
+    parser.add_argument("--skip-scapy", action="store_true", help="skip the (slow) scapy baseline")
+    parser.add_argument("--json", dest="json_path", help="also write results to this file")
+    args = parser.parse_args()
+
+    path = args.pcap
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(prefix="bench-pcap-"), "synthetic.pcap")
+        write_synthetic_pcap(path, args.packets)
+    decoder = pcapdecode.PcapDecoder(path)
+    packets = sum(1 for _ in decoder.records())
+
+    rows = []
+    if not args.skip_scapy and capture.PcapReader is not None:
+        rows.append(_timed("scapy replay_pcap", packets, lambda: sum(1 for _ in capture.replay_pcap(path))))
+    rows.append(_timed("pcapdecode events", packets, lambda: sum(1 for _ in pcapdecode.PcapDecoder(path).events())))
+    if pcapdecode.np is not None:
+        rows.append(
+            _timed("pcapdecode batches", packets, lambda: sum(len(b) for b in pcapdecode.PcapDecoder(path).batches()))
+        )
+        rows.append(
+            _timed(
+                "pcapdecode batches+flows",
+                packets,
+                lambda: len(pcapdecode.aggregate_flows(pcapdecode.PcapDecoder(path).batches())),
+            )
+        )
+
+    print(f"{packets} packets in {path}")
+    for row in rows:
+        print(f"  {row['path']:<26} {row['packets_per_sec']:>12} pkt/s  ({row['seconds']}s, {row['selected']} selected)")
+    if args.json_path:
+        with open(args.json_path, "w") as fh:
+            json.dump({"packets": packets, "results": rows}, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
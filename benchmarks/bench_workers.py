@@ -0,0 +1,115 @@
+"""
+Throughput of the ingest + read cycle as the gunicorn worker count grows.
+
+Each client process owns one session and loops: POST a batch of events, then
+GET /api/events and check the batch it just wrote is visible. With the
+in-memory store and more than one worker those reads land on other processes
+and come back stale; with EVENT_STORE=sqlite they must always be consistent.
+
+    python benchmarks/bench_workers.py --workers 1,2,4 --store sqlite
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _server import start_gunicorn, stop_gunicorn  # noqa: E402
+
+DOMAINS = ["www.google.com", "stats.doubleclick.net", "example.org", "cdn.tracking.io", "github.com"]
+
+
+def _client(port: int, session_id: str, duration: float, batch: int, results) -> None:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    requests_done = stale = errors = 0
+    seq = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        events = []
+        for _ in range(batch):
+            seq += 1
+            events.append({"url": f"https://{DOMAINS[seq % len(DOMAINS)]}/r?marker={seq}", "timestamp": time.time()})
+        body = json.dumps({"session_id": session_id, "events": events})
+        try:
+            conn.request("POST", "/api/browser-events", body, {"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status != 200:
+                errors += 1
+            conn.request("GET", f"/api/events?session_id={session_id}&n=1")
+            resp = conn.getresponse()
+            latest = json.loads(resp.read()).get("events", [])
+            if not latest or not latest[0].get("url", "").endswith(f"marker={seq}"):
+                stale += 1
+            requests_done += 2
+        except (OSError, http.client.HTTPException, ValueError):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    results.put((requests_done, stale, errors))
+
+
+def run(workers: int, store: str, clients: int, duration: float, batch: int, port: int) -> dict:
+    env = {"EVENT_STORE": store}
+    db_dir = tempfile.mkdtemp(prefix="bench-workers-")
+    if store == "sqlite":
+        env["EVENT_STORE_PATH"] = os.path.join(db_dir, "events.db")
+    proc = start_gunicorn(workers, port, env=env)
+    try:
+        results = multiprocessing.Queue()
+        procs = [
+            multiprocessing.Process(target=_client, args=(port, f"bench_{workers}_{i}", duration, batch, results))
+            for i in range(clients)
+        ]
+        started = time.time()
+        for p in procs:
+            p.start()
+        totals = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+        elapsed = time.time() - started
+    finally:
+        stop_gunicorn(proc)
+    requests_done = sum(t[0] for t in totals)
+    return {
+        "workers": workers,
+        "store": store,
+        "clients": clients,
+        "requests_per_sec": round(requests_done / elapsed, 1),
+        "events_per_sec": round(requests_done / 2 * batch / elapsed, 1),
+        "stale_reads": sum(t[1] for t in totals),
+        "errors": sum(t[2] for t in totals),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--store", default="sqlite", choices=["memory", "sqlite"])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--batch", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--json", dest="json_path", help="also write results to this file")
+    args = parser.parse_args()
+
+    rows = []
+    for workers in [int(w) for w in args.workers.split(",") if w]:
+        row = run(workers, args.store, args.clients, args.duration, args.batch, args.port)
+        rows.append(row)
+        print(
+            f"workers={row['workers']:<3} store={row['store']:<7} "
+            f"{row['requests_per_sec']:>9} req/s {row['events_per_sec']:>10} events/s "
+            f"stale={row['stale_reads']} errors={row['errors']}"
+        )
+    if args.json_path:
+        with open(args.json_path, "w") as fh:
+            json.dump(rows, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
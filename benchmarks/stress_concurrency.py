@@ -0,0 +1,141 @@
+"""
+Concurrency stress test for the event store ingest path.
+
+T threads each own a slice of S sessions and push B batches of uniquely
+marked events through the same classify + append path the
+/api/browser-events route uses, while reader threads hammer
+/api/events-style reads and stats. Afterwards every session must hold
+exactly the events written to it: no marker lost or duplicated, seqs
+strictly consecutive, stats matching. Throughput is reported per thread
+count so the effect of the sharded locks is visible.
+
+    python benchmarks/stress_concurrency.py --threads 1,2,4,8 --sessions 256
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import app as app_module  # noqa: E402
+from store import MemoryEventStore  # noqa: E402
+
+DOMAINS = ["www.google.com", "stats.doubleclick.net", "example.org", "cdn.tracking.io", "github.com", "pixel.ads.net"]
+
+
+def _writer(store, sessions, batches, batch_size, thread_id, errors):
+    try:
+        for b in range(batches):
+            for session_id in sessions:
+                events = [
+                    {"url": f"https://{DOMAINS[(b + i) % len(DOMAINS)]}/?m={thread_id}-{b}-{i}", "timestamp": time.time()}
+                    for i in range(batch_size)
+                ]
+                app_module._classify_events(events, session_id)
+                store.append(session_id, events)
+    except Exception as e:  # surfaced in the report, not swallowed
+        errors.append(repr(e))
+
+
+def _reader(store, sessions, stop, errors):
+    i = 0
+    try:
+        while not stop.is_set():
+            session_id = sessions[i % len(sessions)]
+            store.recent(session_id, 50)
+            store.stats(session_id)
+            store.events_since(session_id, store.last_seq(session_id) - 10)
+            i += 1
+    except Exception as e:
+        errors.append(repr(e))
+
+
+def _verify(store, sessions_by_thread, batches, batch_size):
+    problems = []
+    for thread_id, sessions in enumerate(sessions_by_thread):
+        expected = {f"{thread_id}-{b}-{i}" for b in range(batches) for i in range(batch_size)}
+        for session_id in sessions:
+            events = store.recent(session_id, store.max_events)
+            markers = [e["url"].rsplit("m=", 1)[1] for e in events]
+            if len(markers) != len(set(markers)):
+                problems.append(f"{session_id}: duplicated events")
+            if set(markers) != expected:
+                problems.append(f"{session_id}: {len(expected - set(markers))} events lost")
+            seqs = [e["seq"] for e in reversed(events)]
+            if any(b - a != 1 for a, b in zip(seqs, seqs[1:])):
+                problems.append(f"{session_id}: seqs not consecutive")
+            if store.stats(session_id)["total_requests"] != len(expected):
+                problems.append(f"{session_id}: stats total mismatch")
+    return problems
+
+
+def run(threads, sessions, batches, batch_size, readers, shards):
+    per_session = batches * batch_size
+    store = MemoryEventStore(max_events=per_session, max_sessions=sessions * 2, shards=shards)
+    session_ids = [f"stress_{i}" for i in range(sessions)]
+    sessions_by_thread = [session_ids[t::threads] for t in range(threads)]
+    errors = []
+    stop = threading.Event()
+
+    reader_threads = [
+        threading.Thread(target=_reader, args=(store, session_ids, stop, errors)) for _ in range(readers)
+    ]
+    writer_threads = [
+        threading.Thread(target=_writer, args=(store, sessions_by_thread[t], batches, batch_size, t, errors))
+        for t in range(threads)
+    ]
+    for t in reader_threads:
+        t.start()
+    started = time.perf_counter()
+    for t in writer_threads:
+        t.start()
+    for t in writer_threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for t in reader_threads:
+        t.join()
+
+    problems = errors + _verify(store, sessions_by_thread, batches, batch_size)
+    return {
+        "threads": threads,
+        "shards": shards,
+        "events": sessions * per_session,
+        "events_per_sec": round(sessions * per_session / elapsed, 1),
+        "problems": problems,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", default="1,2,4,8", help="comma-separated writer thread counts")
+    parser.add_argument("--sessions", type=int, default=256)
+    parser.add_argument("--batches", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--json", dest="json_path", help="also write results to this file")
+    args = parser.parse_args()
+
+    rows = []
+    failed = False
+    for threads in [int(t) for t in args.threads.split(",") if t]:
+        row = run(threads, args.sessions, args.batches, args.batch_size, args.readers, args.shards)
+        rows.append(row)
+        status = "ok" if not row["problems"] else f"FAILED ({len(row['problems'])} problems)"
+        print(f"threads={threads:<3} shards={row['shards']:<3} {row['events_per_sec']:>10} events/s  {status}")
+        for problem in row["problems"][:10]:
+            print(f"    {problem}")
+        failed = failed or bool(row["problems"])
+    if args.json_path:
+        with open(args.json_path, "w") as fh:
+            json.dump(rows, fh, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,254 @@
+import queue
+import threading
 import time
-from typing import Any, Dict, List
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
 
 try:
-    from scapy.all import IP, TCP, sniff  # type: ignore
+    from scapy.all import IP, TCP, AsyncSniffer, PcapReader, sniff  # type: ignore
 except Exception:  # scapy might be missing or unavailable on some systems
     IP = None  # type: ignore
     TCP = None  # type: ignore
+    AsyncSniffer = None  # type: ignore
+    PcapReader = None  # type: ignore
     sniff = None  # type: ignore
 
+from resolver import BackgroundResolver, learn_from_events, server_name_from_payload
+
+
+WEB_PORTS = (80, 443)
+DEFAULT_BPF_FILTER = "ip and tcp and (dst port 80 or dst port 443)"
+
 
 def _packet_to_event(pkt: Any) -> Dict[str, Any]:
     ts = float(getattr(pkt, "time", time.time()))
     size = int(len(pkt)) if pkt is not None else 0
     dst_ip = None
     dst_port = None
+    server_name = None
     try:
         if IP and pkt.haslayer(IP):
             dst_ip = pkt[IP].dst
         if TCP and pkt.haslayer(TCP):
-            dst_port = int(pkt[TCP].dport)
+            tcp = pkt[TCP]
+            dst_port = int(tcp.dport)
+            if tcp.payload:
+                server_name = server_name_from_payload(bytes(tcp.payload))
     except Exception:
         pass
-    return {
+    event = {
         "dst_ip": dst_ip,
         "dst_port": dst_port,
         "size": size,
         "timestamp": ts,
     }
+    if server_name:
+        # TLS ClientHello SNI or HTTP Host header; lets resolver.learn name dst_ip
+        event["server_name"] = server_name
+    return event
+
+
+class CaptureStats:
+    """Counters for a streaming capture; ``dropped`` counts events lost to a full queue."""
+
+    __slots__ = ("received", "dropped", "errors")
+
+    def __init__(self) -> None:
+        self.received = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {"received": self.received, "dropped": self.dropped, "errors": self.errors}
+
+
+def stream_events(
+    duration_seconds: Optional[float] = 5,
+    bpf_filter: str = DEFAULT_BPF_FILTER,
+    iface: Optional[str] = None,
+    queue_size: int = 10000,
+    stats: Optional[CaptureStats] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield capture events as packets arrive, instead of after the window closes.
+
+    Scapy sniffs in a background thread with ``store=False`` and converts each
+    packet in its ``prn`` callback, so no packet objects are kept. Events pass
+    through a bounded queue: if the consumer falls behind, new events are
+    dropped and counted in ``stats.dropped`` rather than growing memory.
+    ``duration_seconds=None`` captures until the generator is closed.
+
+    Like capture_events, this needs capture privileges; without them (or
+    without scapy) it yields nothing, printing why when the sniffer fails.
+    """
+    stats = stats if stats is not None else CaptureStats()
+    if AsyncSniffer is None:
+        return
+
+    events: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=queue_size)
+
+    def on_packet(pkt: Any) -> None:
+        try:
+            event = _packet_to_event(pkt)
+        except Exception:
+            stats.errors += 1
+            return
+        stats.received += 1
+        try:
+            events.put_nowait(event)
+        except queue.Full:
+            stats.dropped += 1
+
+    # AsyncSniffer does not take ``timeout``; the deadline is enforced below
+    kwargs: Dict[str, Any] = {"filter": bpf_filter, "store": False, "prn": on_packet}
+    if iface is not None:
+        kwargs["iface"] = iface
+
+    sniffer = AsyncSniffer(**kwargs)
+    try:
+        sniffer.start()
+    except Exception as e:
+        # Permission errors or missing backend (libpcap/Npcap) will land here
+        print(f"⚠️ Could not start capture: {e}")
+        return
+
+    deadline = time.monotonic() + duration_seconds if duration_seconds is not None else None
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            try:
+                wait = 0.2 if deadline is None else max(0.0, min(0.2, deadline - time.monotonic()))
+                yield events.get(timeout=wait)
+            except queue.Empty:
+                if not sniffer.running or getattr(sniffer, "exception", None) is not None:
+                    break
+        if getattr(sniffer, "exception", None) is not None:
+            print(f"⚠️ Capture stopped: {sniffer.exception}")
+        if sniffer.running:
+            try:
+                sniffer.stop()
+            except Exception:
+                pass
+        # Drain what arrived between the last poll and the sniffer stopping
+        while True:
+            try:
+                yield events.get_nowait()
+            except queue.Empty:
+                break
+    finally:
+        if sniffer.running:
+            try:
+                sniffer.stop()
+            except Exception:
+                pass
+
+
+def _matches_ports(event: Dict[str, Any], ports: Optional[Iterable[int]]) -> bool:
+    if ports is None:
+        return True
+    return event["dst_ip"] is not None and event["dst_port"] in ports
+
+
+def replay_pcap(
+    path: str,
+    ports: Optional[Tuple[int, ...]] = WEB_PORTS,
+    stats: Optional[CaptureStats] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield events from a .pcap/.pcapng file, one packet at a time.
+
+    PcapReader reads incrementally, so memory stays constant however large the
+    capture is, and no capture privileges are needed. ``ports`` applies the
+    same selection as the live BPF filter (IPv4/TCP to those destination
+    ports); pass None to keep every packet.
+    """
+    stats = stats if stats is not None else CaptureStats()
+    if PcapReader is None:
+        raise RuntimeError("scapy is required to read pcap files")
+    port_set = set(ports) if ports is not None else None
+    with PcapReader(path) as reader:
+        for pkt in reader:
+            try:
+                event = _packet_to_event(pkt)
+            except Exception:
+                stats.errors += 1
+                continue
+            if not _matches_ports(event, port_set):
+                continue
+            stats.received += 1
+            yield event
+
+
+class FlowAggregator:
+    """
+    Rolling per-(dst_ip, dst_port) byte and packet counts over the last
+    ``window_seconds`` of event time.
+
+    Counts are kept in ``resolution``-second buckets, so memory is bounded
+    by the number of buckets in the window times the flows active in them,
+    not by the packet rate. ``on_event`` can be passed as a callback to any
+    of the event sources above.
+    """
+
+    def __init__(self, window_seconds: float = 60.0, resolution: float = 1.0) -> None:
+        self.window_seconds = window_seconds
+        self.resolution = resolution
+        self._buckets: Deque[Tuple[int, Dict[Tuple[Any, Any], List[float]]]] = deque()
+        self._totals: Dict[Tuple[Any, Any], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def _expire(self, now_bucket: int) -> None:
+        oldest = now_bucket - int(self.window_seconds / self.resolution)
+        while self._buckets and self._buckets[0][0] <= oldest:
+            _, flows = self._buckets.popleft()
+            for key, (nbytes, packets, _) in flows.items():
+                total = self._totals[key]
+                total[0] -= nbytes
+                total[1] -= packets
+                if total[1] <= 0:
+                    del self._totals[key]
+
+    def on_event(self, event: Dict[str, Any]) -> None:
+        key = (event.get("dst_ip"), event.get("dst_port"))
+        ts = float(event.get("timestamp") or time.time())
+        size = int(event.get("size") or 0)
+        bucket = int(ts // self.resolution)
+        with self._lock:
+            if not self._buckets or self._buckets[-1][0] < bucket:
+                self._buckets.append((bucket, {}))
+                self._expire(bucket)
+            # Late packets are counted in the newest bucket rather than reordering.
+            flows = self._buckets[-1][1]
+            entry = flows.get(key)
+            if entry is None:
+                flows[key] = [size, 1, ts]
+            else:
+                entry[0] += size
+                entry[1] += 1
+                entry[2] = max(entry[2], ts)
+            total = self._totals.get(key)
+            if total is None:
+                self._totals[key] = [size, 1, ts]
+            else:
+                total[0] += size
+                total[1] += 1
+                total[2] = max(total[2], ts)
+
+    def feed(self, events: Iterable[Dict[str, Any]]) -> "FlowAggregator":
+        for event in events:
+            self.on_event(event)
+        return self
+
+    def snapshot(self, now: Optional[float] = None, top: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Current flows, largest first; ``now`` additionally expires buckets older than the window."""
+        with self._lock:
+            if now is not None:
+                self._expire(int(now // self.resolution))
+            flows = [
+                {"dst_ip": ip, "dst_port": port, "bytes": int(b), "packets": int(p), "last_seen": last}
+                for (ip, port), (b, p, last) in self._totals.items()
+            ]
+        flows.sort(key=lambda f: f["bytes"], reverse=True)
+        return flows[:top] if top is not None else flows
 
 
 def capture_events(duration_seconds: int = 5) -> List[Dict[str, Any]]:
@@ -35,38 +257,47 @@ def capture_events(duration_seconds: int = 5) -> List[Dict[str, Any]]:
 
     Returns a list of small event dicts consumable by a Flask backend:
       { dst_ip, dst_port, size, timestamp }
+    plus ``server_name`` for packets carrying a TLS SNI or HTTP Host header.
 
     Notes:
     - Scapy sniffing generally requires root/admin privileges on Linux/macOS and
       Npcap/Admin on Windows. Without sufficient privileges, this will likely
       return an empty list.
     - Uses a BPF filter for efficiency: "ip and tcp and (dst port 80 or dst port 443)".
+    - Built on stream_events, so packets are converted as they arrive and never
+      held in memory; use stream_events directly to consume them live.
     """
-    events: List[Dict[str, Any]] = []
-
-    if sniff is None:
-        return events
-
-    bpf_filter = "ip and tcp and (dst port 80 or dst port 443)"
-
-    try:
-        # store=True collects packets for post-processing; timeout bounds capture duration
-        packets = sniff(filter=bpf_filter, store=True, timeout=duration_seconds)
-    except Exception:
-        # Permission errors or missing backend (libpcap/Npcap) will land here
-        return events
-
-    for pkt in packets or []:
-        try:
-            events.append(_packet_to_event(pkt))
-        except Exception:
-            continue
-
-    return events
+    return list(stream_events(duration_seconds))
 
 
 if __name__ == "__main__":
+    import argparse
     import json
-    print(json.dumps(capture_events(), indent=2))
 
+    parser = argparse.ArgumentParser(description="Capture or replay outbound web traffic")
+    parser.add_argument("--pcap", help="replay this .pcap/.pcapng file instead of sniffing")
+    parser.add_argument("--duration", type=float, default=5, help="live capture window in seconds")
+    parser.add_argument("--flows", action="store_true", help="print per-flow aggregates instead of events")
+    parser.add_argument("--window", type=float, default=60.0, help="flow aggregation window in seconds")
+    parser.add_argument("--resolve", action="store_true", help="add a hostname (SNI/Host, else reverse DNS) per address")
+    args = parser.parse_args()
 
+    stats = CaptureStats()
+    source = replay_pcap(args.pcap, stats=stats) if args.pcap else stream_events(args.duration, stats=stats)
+    resolver = BackgroundResolver() if args.resolve else None
+    if resolver is not None:
+        source = learn_from_events(resolver, source)
+    if args.flows:
+        aggregator = FlowAggregator(window_seconds=args.window).feed(source)
+        output: Any = aggregator.snapshot(top=50)
+    else:
+        output = list(source)
+    if resolver is not None:
+        hosts = resolver.resolve_many(item["dst_ip"] for item in output)
+        for item in output:
+            item["hostname"] = hosts.get(item["dst_ip"])
+        resolver.close()
+    if args.flows:
+        print(json.dumps({"flows": output, "stats": stats.as_dict()}, indent=2))
+    else:
+        print(json.dumps(output, indent=2))
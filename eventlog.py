@@ -0,0 +1,403 @@
+import gzip
+import json
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Set
+
+from stats import EVENT_FIELDS
+
+Event = Dict[str, Any]
+Listener = Callable[[List[Event]], None]
+
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024  # uncompressed JSONL per segment
+DEFAULT_MAX_SEGMENTS = 100
+DEFAULT_MAX_QUEUED_EVENTS = 100000
+DEFAULT_GROUP_EVENTS = 50000
+DEFAULT_TAIL_INTERVAL = 1.0
+
+SEGMENT_PREFIX = "events-"
+SEGMENT_SUFFIX = ".jsonl.gz"
+OPEN_SUFFIX = ".open"
+
+
+def _log_record(session_id: str, event: Event) -> Event:
+    record = {field: event[field] for field in EVENT_FIELDS if event.get(field) is not None}
+    record["session_id"] = session_id
+    return record
+
+
+def _log_line(record: Event) -> str:
+    return json.dumps(record, separators=(",", ":"), default=str) + "\n"
+
+
+def segment_paths(directory: str) -> List[str]:
+    """Finished and in-progress segments in write order (names start with a ns timestamp)."""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    names = [n for n in names if n.startswith(SEGMENT_PREFIX) and (n.endswith(SEGMENT_SUFFIX) or n.endswith(OPEN_SUFFIX))]
+    return [os.path.join(directory, n) for n in sorted(names)]
+
+
+class _SegmentReader:
+    """
+    Incremental decoder for one segment: feed it the file's bytes in order,
+    in any chunking, and it returns the complete lines decoded so far. A
+    segment being written can be read this way as it grows, since every
+    commit ends in a sync flush.
+    """
+
+    __slots__ = ("offset", "broken", "done", "_decomp", "_pending")
+
+    def __init__(self) -> None:
+        self.offset = 0
+        self.broken = False
+        self.done = False
+        self._decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._pending = b""
+
+    def feed(self, chunk: bytes) -> List[Event]:
+        if self.broken:
+            return []
+        self.offset += len(chunk)
+        decomp = self._decomp
+        try:
+            data = decomp.decompress(chunk)
+            # gzip allows several concatenated members in one file; read them all
+            while decomp.eof and decomp.unused_data:
+                rest = decomp.unused_data
+                decomp = self._decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                data += decomp.decompress(rest)
+        except zlib.error:
+            self.broken = True
+            return []
+        lines = (self._pending + data).split(b"\n")
+        self._pending = lines.pop()
+        events = []
+        for line in lines:
+            if line:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    continue
+        return events
+
+    def finish(self) -> None:
+        """Mark the segment as fully read and drop the decoder state."""
+        self.done = True
+        self._decomp = None
+        self._pending = b""
+
+
+def read_segment(path: str) -> Iterator[Event]:
+    """
+    Events of one segment. A segment cut short by a crash ends in a partial
+    gzip member and a partial line; everything before the break is returned.
+    """
+    reader = _SegmentReader()
+    with open(path, "rb") as fh:
+        while True:
+            chunk = fh.read(1 << 20)
+            if not chunk:
+                break
+            yield from reader.feed(chunk)
+            if reader.broken:
+                break
+
+
+def replay(directory: str, batch_size: int = 10000) -> Iterator[List[Event]]:
+    """Every logged event, oldest segment first, in lists of up to ``batch_size``."""
+    batch: List[Event] = []
+    for path in segment_paths(directory):
+        for event in read_segment(path):
+            batch.append(event)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+class EventLog:
+    """
+    Append-only, gzip-compressed JSONL log of accepted events, written by a
+    background thread with group commit.
+
+    ``append`` only queues the batch, reduced to the logged fields, so a
+    request never waits on disk. The writer takes everything queued since its
+    last commit, writes it as one chunk, then syncs the compressed stream and
+    fsyncs once, so under load one fsync covers many requests. The queue holds
+    at most ``max_queued_events`` events; beyond that (the disk cannot keep
+    up) events are counted in ``dropped`` instead of blocking ingest.
+
+    Segments rotate after ``segment_bytes`` of uncompressed JSONL; the one
+    being written carries an ``.open`` suffix until it is closed, and only the
+    newest ``max_segments`` are kept. Each process writes its own segments
+    (the pid is in the name), so gunicorn workers can share ``directory``.
+    Every ``tail_interval`` seconds the writer also reads what the other
+    processes committed to their segments since its last look, so the
+    listeners of every worker see the traffic of all of them.
+
+    Committed records (logged fields plus ``session_id``) are also passed to
+    ``listeners`` (e.g. GlobalStats.observe) on the writer thread. With ``rebuild=True`` the
+    listeners first see every event already in the log, so in-memory
+    analytics survive a restart; without it only events logged after startup
+    are passed on. ``directory=None`` disables persistence
+    but still feeds the listeners off the request path.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str],
+        listeners: Sequence[Listener] = (),
+        segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+        max_segments: int = DEFAULT_MAX_SEGMENTS,
+        max_queued_events: int = DEFAULT_MAX_QUEUED_EVENTS,
+        group_events: int = DEFAULT_GROUP_EVENTS,
+        fsync: bool = True,
+        rebuild: bool = True,
+        tail_interval: float = DEFAULT_TAIL_INTERVAL,
+    ) -> None:
+        self.directory = directory
+        self.listeners = list(listeners)
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.max_queued_events = max_queued_events
+        self.group_events = group_events
+        self.fsync = fsync
+        self.rebuild = rebuild
+        self.tail_interval = tail_interval
+        self.written = 0
+        self.dropped = 0
+        self.commits = 0
+        self.replayed = 0
+        self.tailed = 0
+        self.rebuilding = rebuild and directory is not None
+        self._pending: Deque[List[Event]] = deque()
+        self._pending_events = 0
+        self._cond = threading.Condition()
+        self._closing = False
+        self._file: Any = None
+        self._gzip: Optional[gzip.GzipFile] = None
+        self._segment_path: Optional[str] = None
+        self._segment_written = 0
+        self._own: Set[str] = set()  # our segments, by finished path
+        self._readers: Dict[str, _SegmentReader] = {}  # other segments, by finished path
+        self._closed = threading.Event()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="event-log-writer", daemon=True)
+        self._thread.start()
+
+    def append(self, session_id: str, events: List[Event]) -> bool:
+        """Queue classified events for the log; False if they had to be dropped."""
+        if not events or self._closed.is_set():
+            return False
+        records = [_log_record(session_id, e) for e in events]
+        with self._cond:
+            if self._closing or self._pending_events + len(records) > self.max_queued_events:
+                self.dropped += len(records)
+                return False
+            self._pending.append(records)
+            self._pending_events += len(records)
+            self._cond.notify()
+        return True
+
+    # -- writer thread -------------------------------------------------------
+
+    def _replay_existing(self) -> None:
+        if self.directory is None:
+            return
+        # Segments left open by a process that is gone (crash, hard kill) are finished as they are
+        for path in segment_paths(self.directory):
+            if path.endswith(OPEN_SUFFIX) and not self._writer_alive(path):
+                try:
+                    os.replace(path, path[: -len(OPEN_SUFFIX)])
+                except OSError:  # another worker starting up got there first
+                    pass
+        if not self.rebuild:
+            # Skip the history, but keep following segments still being written
+            for path in segment_paths(self.directory):
+                if not path.endswith(OPEN_SUFFIX):
+                    reader = self._readers[path] = _SegmentReader()
+                    reader.finish()
+        self.replayed += self._tail(notify=self.rebuild)
+        self.rebuilding = False
+
+    def _tail(self, notify: bool = True, batch_size: int = 10000) -> int:
+        """Read what other processes added to their segments since the last call."""
+        assert self.directory is not None
+        listed = set()
+        count = 0
+        for path in segment_paths(self.directory):
+            key = path[: -len(OPEN_SUFFIX)] if path.endswith(OPEN_SUFFIX) else path
+            listed.add(key)
+            if key in self._own:
+                continue
+            reader = self._readers.get(key)
+            if reader is None:
+                reader = self._readers[key] = _SegmentReader()
+            if reader.done:
+                continue
+            try:
+                with open(path, "rb") as fh:
+                    fh.seek(reader.offset)
+                    batch: List[Event] = []
+                    while not reader.broken:
+                        chunk = fh.read(1 << 20)
+                        if not chunk:
+                            break
+                        batch.extend(reader.feed(chunk))
+                        if len(batch) >= batch_size:
+                            count += len(batch)
+                            if notify:
+                                self._notify(batch)
+                            batch = []
+                    if batch:
+                        count += len(batch)
+                        if notify:
+                            self._notify(batch)
+            except OSError:  # finished or pruned since listed; picked up under its new name next time
+                continue
+            # A finished segment no longer grows: drop its decoder state
+            if reader.broken or not path.endswith(OPEN_SUFFIX):
+                reader.finish()
+        for key in list(self._readers):
+            if key not in listed:
+                del self._readers[key]
+        self._own &= listed
+        return count
+
+    @staticmethod
+    def _writer_alive(path: str) -> bool:
+        try:
+            pid = int(os.path.basename(path).split(".", 1)[0].rsplit("-", 1)[1])
+        except (ValueError, IndexError):
+            return False
+        if pid == os.getpid():  # a previous process with our (reused) pid
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _notify(self, events: List[Event]) -> None:
+        for listener in self.listeners:
+            try:
+                listener(events)
+            except Exception as e:
+                print(f"❌ Event log listener failed: {e}")
+
+    def _open_segment(self) -> None:
+        assert self.directory is not None
+        name = f"{SEGMENT_PREFIX}{time.time_ns():020d}-{os.getpid()}{SEGMENT_SUFFIX}{OPEN_SUFFIX}"
+        self._segment_path = os.path.join(self.directory, name)
+        self._own.add(self._segment_path[: -len(OPEN_SUFFIX)])
+        self._file = open(self._segment_path, "ab")
+        self._gzip = gzip.GzipFile(fileobj=self._file, mode="wb", compresslevel=1)  # fastest level; JSONL still compresses ~8x
+        self._segment_written = 0
+
+    def _close_segment(self) -> None:
+        if self._gzip is None:
+            return
+        self._gzip.close()
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._file.close()
+        assert self._segment_path is not None
+        os.replace(self._segment_path, self._segment_path[: -len(OPEN_SUFFIX)])
+        self._gzip = self._file = self._segment_path = None
+        self._prune()
+
+    def _prune(self) -> None:
+        assert self.directory is not None
+        finished = [p for p in segment_paths(self.directory) if p.endswith(SEGMENT_SUFFIX)]
+        for path in finished[: max(0, len(finished) - self.max_segments)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _commit(self, group: List[Event]) -> None:
+        if self.directory is not None:
+            data = "".join(map(_log_line, group)).encode()
+            if self._gzip is None:
+                self._open_segment()
+            assert self._gzip is not None
+            self._gzip.write(data)
+            # Sync flush: everything written so far is decodable even if the process dies now
+            self._gzip.flush(zlib.Z_SYNC_FLUSH)
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._segment_written += len(data)
+            if self._segment_written >= self.segment_bytes:
+                self._close_segment()
+        self.written += len(group)
+        self.commits += 1
+        self._notify(group)
+
+    def _run(self) -> None:
+        try:
+            self._replay_existing()
+        except Exception as e:
+            self.rebuilding = False
+            print(f"❌ Could not rebuild from event log: {e}")
+        tailing = self.directory is not None and self.tail_interval > 0
+        next_tail = time.monotonic() + self.tail_interval
+        while True:
+            with self._cond:
+                if not self._pending and not self._closing:
+                    self._cond.wait(max(0.0, next_tail - time.monotonic()) if tailing else None)
+                if not self._pending and self._closing:
+                    break
+                # Group commit: everything that queued up during the previous write goes in this one
+                group: List[Event] = []
+                while self._pending and len(group) < self.group_events:
+                    group.extend(self._pending.popleft())
+                self._pending_events -= len(group)
+            if group:
+                try:
+                    self._commit(group)
+                except Exception as e:
+                    print(f"❌ Error writing event log: {e}")
+            if tailing and time.monotonic() >= next_tail:
+                try:
+                    self.tailed += self._tail()
+                except Exception as e:
+                    print(f"❌ Error reading other workers' event log segments: {e}")
+                next_tail = time.monotonic() + self.tail_interval
+        if self.directory is not None:
+            try:
+                self._close_segment()
+            except Exception as e:
+                print(f"❌ Error closing event log segment: {e}")
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Write everything queued so far, finish the open segment and stop the writer."""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "written": self.written,
+            "dropped": self.dropped,
+            "commits": self.commits,
+            "queued_events": self._pending_events,
+            "replayed": self.replayed,
+            "tailed": self.tailed,
+            "rebuilding": self.rebuilding,
+            "persistent": self.directory is not None,
+        }
@@ -0,0 +1,116 @@
+import json
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import msgpack  # type: ignore
+except Exception:  # msgpack is optional; NDJSON and JSON always work
+    msgpack = None  # type: ignore
+
+Event = Dict[str, Any]
+
+NDJSON_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl", "application/json-lines"}
+MSGPACK_TYPES = {"application/msgpack", "application/x-msgpack", "application/vnd.msgpack"}
+
+MAX_BODY_BYTES = 8 * 1024 * 1024  # compressed or raw request body
+MAX_DECODED_BYTES = 32 * 1024 * 1024  # after gunzip
+MAX_BATCH_EVENTS = 20000
+
+
+class IngestError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def is_bulk(mimetype: str, content_encoding: str) -> bool:
+    """True for payloads the bulk path handles (NDJSON, msgpack, or anything gzip'd)."""
+    return mimetype in NDJSON_TYPES or mimetype in MSGPACK_TYPES or content_encoding == "gzip"
+
+
+def _gunzip(body: bytes) -> bytes:
+    decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decomp.decompress(body, MAX_DECODED_BYTES + 1)
+    except zlib.error:
+        raise IngestError(400, "Invalid gzip body")
+    if len(data) > MAX_DECODED_BYTES or decomp.unconsumed_tail:
+        raise IngestError(413, "Decompressed payload too large")
+    return data
+
+
+def _parse_ndjson(data: bytes) -> Tuple[Optional[str], List[Event], int]:
+    session_id = None
+    events: List[Event] = []
+    rejected = 0
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError:
+            rejected += 1
+            continue
+        if not isinstance(obj, dict):
+            rejected += 1
+        elif "events" in obj or set(obj) == {"session_id"}:
+            # Optional header line: {"session_id": ...}; a legacy JSON payload on one line also parses
+            session_id = obj.get("session_id", session_id)
+            events.extend(e for e in obj.get("events", []) if isinstance(e, dict))
+        else:
+            events.append(obj)
+    return session_id, events, rejected
+
+
+def _parse_payload(payload: Any) -> Tuple[Optional[str], List[Event], int]:
+    if isinstance(payload, dict):
+        if "events" not in payload:
+            raise IngestError(400, "Invalid payload")
+        session_id = payload.get("session_id")
+        items = payload.get("events") or []
+    elif isinstance(payload, list):
+        session_id, items = None, payload
+    else:
+        raise IngestError(400, "Invalid payload")
+    events = [e for e in items if isinstance(e, dict)]
+    return session_id, events, len(items) - len(events)
+
+
+def decode_batch(body: bytes, mimetype: str, content_encoding: str) -> Tuple[Optional[str], List[Event], int]:
+    """
+    Decode a bulk ingest body into (session_id, events, rejected).
+
+    Accepts NDJSON (one event per line, optionally a leading
+    {"session_id": ...} line), msgpack (an array of events or the legacy
+    {"session_id", "events"} map) and the legacy JSON body, each optionally
+    gzip-compressed (Content-Encoding: gzip). Malformed lines are counted in
+    ``rejected`` rather than failing the whole batch.
+    """
+    if len(body) > MAX_BODY_BYTES:
+        raise IngestError(413, "Payload too large")
+    if content_encoding == "gzip":
+        body = _gunzip(body)
+    elif content_encoding not in ("", "identity"):
+        raise IngestError(415, f"Unsupported Content-Encoding: {content_encoding}")
+
+    if mimetype in MSGPACK_TYPES:
+        if msgpack is None:
+            raise IngestError(415, "msgpack is not installed on this server")
+        try:
+            payload = msgpack.unpackb(body, raw=False)
+        except Exception:
+            raise IngestError(400, "Invalid msgpack body")
+        session_id, events, rejected = _parse_payload(payload)
+    elif mimetype in NDJSON_TYPES:
+        session_id, events, rejected = _parse_ndjson(body)
+    else:
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            raise IngestError(400, "Invalid payload")
+        session_id, events, rejected = _parse_payload(payload)
+
+    if len(events) > MAX_BATCH_EVENTS:
+        raise IngestError(413, f"Batch exceeds {MAX_BATCH_EVENTS} events")
+    return session_id, events, rejected
@@ -0,0 +1,326 @@
+import json
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Seconds; spans sub-millisecond reads up to slow bulk ingests
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]
+Family = Tuple[str, str, str, List[Sample]]  # name, help, kind, samples
+
+SNAPSHOT_PREFIX = "metrics-"
+SNAPSHOT_SUFFIX = ".json"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_sample(name: str, labels: Dict[str, str], value: float) -> str:
+    if labels:
+        name += "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+    if isinstance(value, float) and math.isinf(value):
+        return f"{name} {'+Inf' if value > 0 else '-Inf'}"
+    return f"{name} {value}"
+
+
+class Counter:
+    """Monotonic counter, optionally split by label values."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, labels: Labels = ()) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, dict(zip(self.label_names, labels)), value) for labels, value in items]
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus layout.
+
+    ``observe`` is a linear scan over the short bucket list plus two additions
+    under one lock, so it is cheap enough to run on every request.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket (non-cumulative, last is +Inf), sum]
+        self._values: Dict[Labels, List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        out: List[Sample] = []
+        for labels, counts, total in items:
+            base = dict(zip(self.label_names, labels))
+            running = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                running += count
+                out.append((f"{self.name}_bucket", {**base, "le": "+Inf" if math.isinf(bound) else repr(bound)}, running))
+            out.append((f"{self.name}_sum", base, total))
+            out.append((f"{self.name}_count", base, running))
+        return out
+
+
+class _Callback:
+    """A metric whose value is read at scrape time (store sizes, cache_info, lock timers)."""
+
+    def __init__(self, name: str, help: str, kind: str, fn: Callable[[], Any]) -> None:
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.fn = fn
+
+    def samples(self) -> List[Sample]:
+        value = self.fn()
+        if value is None:
+            return []
+        if isinstance(value, (int, float)):
+            return [(self.name, {}, value)]
+        return [(self.name, labels, v) for labels, v in value]
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registry:
+    """
+    Named metrics rendered together in the Prometheus text exposition format.
+
+    Every metric lives in the process that updates it, so behind several
+    gunicorn workers a scrape only reaches one of them. ``pid_label`` adds
+    the process id to every sample to keep the workers' series apart. With a
+    ``directory`` shared by the workers, each one writes a snapshot of its
+    samples there every ``snapshot_interval`` seconds (see
+    ``start_snapshots``) and ``render`` returns the samples of all live
+    workers, the others as of their last snapshot.
+    """
+
+    def __init__(
+        self,
+        prefix: str = "",
+        pid_label: Optional[str] = None,
+        directory: Optional[str] = None,
+        snapshot_interval: float = 5.0,
+    ) -> None:
+        self.prefix = prefix
+        self.pid_label = pid_label
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self._metrics: List[Any] = []
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def counter(self, name: str, help: str, label_names: Sequence[str] = ()) -> Counter:
+        metric = Counter(self.prefix + name, help, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self, name: str, help: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        metric = Histogram(self.prefix + name, help, label_names, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge_fn(self, name: str, help: str, fn: Callable[[], Any], kind: str = "gauge") -> None:
+        """
+        Register a value computed at scrape time. ``fn`` returns a number, an
+        iterable of (labels, value) pairs, or None to omit the metric.
+        """
+        self._metrics.append(_Callback(self.prefix + name, help, kind, fn))
+
+    def collect(self) -> List[Family]:
+        """This process's metrics, with the pid label if one is configured."""
+        pid = str(os.getpid())  # read now, not at construction: workers may be forked after import
+        families: List[Family] = []
+        for metric in self._metrics:
+            try:
+                samples = metric.samples()
+            except Exception:  # one broken source must not take the whole scrape down
+                continue
+            if self.pid_label:
+                samples = [(name, {self.pid_label: pid, **labels}, value) for name, labels, value in samples]
+            families.append((metric.name, metric.help, metric.kind, samples))
+        return families
+
+    def _snapshot_path(self, pid: int) -> str:
+        assert self.directory is not None
+        return os.path.join(self.directory, f"{SNAPSHOT_PREFIX}{pid}{SNAPSHOT_SUFFIX}")
+
+    def write_snapshot(self, families: Optional[List[Family]] = None) -> None:
+        """Write this process's samples to ``directory`` for the other workers to serve."""
+        path = self._snapshot_path(os.getpid())
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as fh:
+            json.dump(families if families is not None else self.collect(), fh)
+        os.replace(tmp, path)
+
+    def _peer_snapshots(self) -> List[List[Family]]:
+        assert self.directory is not None
+        own = os.getpid()
+        snapshots = []
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX)):
+                continue
+            try:
+                pid = int(name[len(SNAPSHOT_PREFIX) : -len(SNAPSHOT_SUFFIX)])
+            except ValueError:
+                continue
+            if pid == own:
+                continue
+            path = os.path.join(self.directory, name)
+            if not _pid_alive(pid):  # an exited worker: its series end with it
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path) as fh:
+                    snapshots.append(json.load(fh))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def start_snapshots(self) -> None:
+        """Snapshot every ``snapshot_interval`` seconds from a daemon thread, also in forked children."""
+
+        def run() -> None:
+            while True:
+                time.sleep(self.snapshot_interval)
+                try:
+                    self.write_snapshot()
+                except Exception as e:
+                    print(f"❌ Could not write metrics snapshot: {e}")
+
+        def start() -> None:
+            threading.Thread(target=run, name="metrics-snapshot", daemon=True).start()
+
+        start()
+        os.register_at_fork(after_in_child=start)
+
+    def render(self) -> str:
+        families = self.collect()
+        if self.directory is not None:
+            self.write_snapshot(families)
+            merged: Dict[str, Family] = {}
+            for snapshot in [families] + self._peer_snapshots():
+                for name, help, kind, samples in snapshot:
+                    if name in merged:
+                        merged[name][3].extend(samples)
+                    else:
+                        merged[name] = (name, help, kind, list(samples))
+            families = list(merged.values())
+        lines = []
+        for name, help, kind, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(_format_sample(sample_name, labels, value) for sample_name, labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+class TimedLock:
+    """
+    Drop-in ``threading.Lock`` that accumulates time spent waiting for it and
+    holding it.
+
+    The counters are only updated while the lock is held, so they need no lock
+    of their own. An uncontended acquire costs a single clock read on top of
+    the plain lock; the wait clock only starts when the lock is busy.
+    """
+
+    __slots__ = ("_lock", "acquisitions", "contended", "wait_seconds", "hold_seconds", "_acquired_at")
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_seconds = 0.0
+        self.hold_seconds = 0.0
+        self._acquired_at = 0.0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if self._lock.acquire(False):
+            self._acquired_at = time.perf_counter()
+        else:
+            if not blocking:
+                return False
+            started = time.perf_counter()
+            if not self._lock.acquire(True, timeout):
+                return False
+            self._acquired_at = time.perf_counter()
+            self.contended += 1
+            self.wait_seconds += self._acquired_at - started
+        self.acquisitions += 1
+        return True
+
+    def release(self) -> None:
+        self.hold_seconds += time.perf_counter() - self._acquired_at
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.release()
+
+
+def lock_totals(locks: Iterable[Any]) -> Optional[Dict[str, float]]:
+    """Summed TimedLock counters, or None if none of ``locks`` is timed."""
+    timed = [lock for lock in locks if isinstance(lock, TimedLock)]
+    if not timed:
+        return None
+    return {
+        "acquisitions": sum(lock.acquisitions for lock in timed),
+        "contended": sum(lock.contended for lock in timed),
+        "wait_seconds": sum(lock.wait_seconds for lock in timed),
+        "hold_seconds": sum(lock.hold_seconds for lock in timed),
+    }
@@ -1,5 +1,10 @@
+import ipaddress
+import os
+import socket
+import sys
+import threading
 import time
-from typing import Any, Dict, List, Optional, Set, Tuple
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
 
 try:
     import psutil
@@ -9,6 +14,8 @@ except Exception:  # psutil may be absent in some environments
     AccessDenied = Exception  # type: ignore
     NoSuchProcess = Exception  # type: ignore
 
+from resolver import BackgroundResolver
+
 
 ConnectionRecord = Dict[str, Any]
 
@@ -140,11 +147,348 @@ def sample_connections() -> List[ConnectionRecord]:
     return records
 
 
+_TCP_ESTABLISHED = "01"
+_SOCKET_LINK_PREFIX = "socket:["
+
+
+def _parse_proc_addr(field: str, family: int) -> Tuple[str, int]:
+    """Decode "0100007F:0050" (address words in host byte order, port in hex) to ("127.0.0.1", 80)."""
+    addr_hex, port_hex = field.split(":")
+    raw = bytes.fromhex(addr_hex)
+    if sys.byteorder == "little":
+        raw = b"".join(raw[i : i + 4][::-1] for i in range(0, len(raw), 4))
+    return socket.inet_ntop(family, raw), int(port_hex, 16)
+
+
+def _read_proc_net_tcp(proc_root: str) -> List[Tuple[Tuple[str, int], Tuple[str, int], int]]:
+    """Established TCP sockets from /proc/net/tcp{,6} as (laddr, raddr, inode)."""
+    results = []
+    for name, family in (("tcp", socket.AF_INET), ("tcp6", socket.AF_INET6)):
+        try:
+            with open(os.path.join(proc_root, "net", name)) as fh:
+                next(fh, None)  # header
+                for line in fh:
+                    fields = line.split()
+                    if len(fields) < 10 or fields[3] != _TCP_ESTABLISHED:
+                        continue
+                    try:
+                        laddr = _parse_proc_addr(fields[1], family)
+                        raddr = _parse_proc_addr(fields[2], family)
+                    except (ValueError, OSError):
+                        continue
+                    results.append((laddr, raddr, int(fields[9])))
+        except OSError:
+            continue
+    return results
+
+
+class ConnectionTracker:
+    """
+    Long-lived sampler that reports connection changes instead of full sets.
+
+    Each ``sample()`` returns the outgoing ESTABLISHED/CONNECTED connections
+    that appeared ({ pid, process_name, laddr, raddr, status, timestamp,
+    opened_at }) and those that went away (the same record plus closed_at and
+    duration), keyed by (laddr, raddr).
+
+    On Linux the tracker parses /proc/net/tcp and /proc/net/tcp6 directly and
+    resolves socket inodes to pids by reading /proc/<pid>/fd. That mapping is
+    kept across samples and only extended when an unknown inode shows up:
+    processes that already own connections and processes started since the
+    last sample are searched first, and a scan of every process happens at
+    most once per ``rescan_interval``. Elsewhere it
+    falls back to psutil. Process names are cached per pid together with the
+    process start time, so a recycled pid is detected and re-resolved.
+    """
+
+    def __init__(self, proc_root: str = "/proc", use_proc: Optional[bool] = None, rescan_interval: float = 5.0) -> None:
+        self.proc_root = proc_root
+        if use_proc is None:
+            use_proc = sys.platform.startswith("linux") and os.path.exists(os.path.join(proc_root, "net", "tcp"))
+        self.use_proc = use_proc
+        self.rescan_interval = rescan_interval
+        self.open: Dict[Tuple[Optional[str], Optional[str]], ConnectionRecord] = {}
+        self._names: Dict[int, Tuple[Any, Optional[str]]] = {}  # pid -> (start time, name)
+        self._inode_pid: Dict[int, int] = {}
+        self._owner_pids: Set[int] = set()
+        self._known_pids: Set[int] = set()
+        self._next_full_scan = 0.0
+
+    # -- process names -------------------------------------------------------
+
+    def _start_time(self, pid: int) -> Any:
+        if self.use_proc:
+            try:
+                with open(os.path.join(self.proc_root, str(pid), "stat")) as fh:
+                    stat = fh.read()
+                # Field 22 (starttime); comm (field 2) may contain spaces, so split after its ")"
+                return int(stat[stat.rindex(")") + 2 :].split()[19])
+            except (OSError, ValueError, IndexError):
+                return None
+        if not psutil:
+            return None
+        try:
+            return psutil.Process(pid).create_time()
+        except Exception:
+            return None
+
+    def _read_name(self, pid: int) -> Optional[str]:
+        if self.use_proc:
+            try:
+                with open(os.path.join(self.proc_root, str(pid), "comm")) as fh:
+                    return fh.read().strip() or None
+            except OSError:
+                return None
+        return _get_process_name(pid, {})
+
+    def process_name(self, pid: Optional[int]) -> Optional[str]:
+        if pid is None:
+            return None
+        started = self._start_time(pid)
+        cached = self._names.get(pid)
+        if cached is not None and cached[0] == started and started is not None:
+            return cached[1]
+        name = self._read_name(pid)
+        if started is not None:
+            self._names[pid] = (started, name)
+        return name
+
+    # -- inode -> pid --------------------------------------------------------
+
+    def _scan_pid(self, pid: int, wanted: Set[int]) -> None:
+        fd_dir = os.path.join(self.proc_root, str(pid), "fd")
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:  # process gone or owned by another user
+            return
+        for fd in fds:
+            try:
+                link = os.readlink(os.path.join(fd_dir, fd))
+            except OSError:
+                continue
+            if link.startswith(_SOCKET_LINK_PREFIX):
+                inode = int(link[len(_SOCKET_LINK_PREFIX) : -1])
+                if inode in wanted:
+                    self._inode_pid[inode] = pid
+                    self._owner_pids.add(pid)
+                    wanted.discard(inode)
+
+    def _resolve_inodes(self, inodes: Iterable[int], now: float) -> None:
+        wanted = {inode for inode in inodes if inode and inode not in self._inode_pid}
+        if not wanted:
+            return
+        try:
+            pids = {int(entry) for entry in os.listdir(self.proc_root) if entry.isdigit()}
+        except OSError:
+            return
+        # Most new sockets belong to a process that already owns one, or to one started since the last sample
+        for pid in [p for p in self._owner_pids if p in pids] + [p for p in pids if p not in self._known_pids]:
+            self._scan_pid(pid, wanted)
+            if not wanted:
+                break
+        self._known_pids = pids
+        if not wanted or now < self._next_full_scan:
+            return
+        self._next_full_scan = now + self.rescan_interval
+        for pid in pids:
+            self._scan_pid(pid, wanted)
+            if not wanted:
+                return
+
+    # -- sampling ------------------------------------------------------------
+
+    def _current_proc(self, now: float) -> Dict[Tuple[Optional[str], Optional[str]], Tuple[Optional[int], str]]:
+        sockets = _read_proc_net_tcp(self.proc_root)
+        live_inodes = {inode for _, _, inode in sockets}
+        # Drop mappings for sockets that no longer exist so the cache cannot grow without bound
+        for inode in [i for i in self._inode_pid if i not in live_inodes]:
+            del self._inode_pid[inode]
+        # Only connections not yet attributed to a process need an inode lookup
+        new_inodes = []
+        for laddr, raddr, inode in sockets:
+            record = self.open.get((_format_addr(laddr), _format_addr(raddr)))
+            if record is None or record["pid"] is None:
+                new_inodes.append(inode)
+        self._resolve_inodes(new_inodes, now)
+        self._owner_pids = set(self._inode_pid.values())
+        return {
+            (_format_addr(laddr), _format_addr(raddr)): (self._inode_pid.get(inode), "ESTABLISHED")
+            for laddr, raddr, inode in sockets
+        }
+
+    def _current_psutil(self) -> Dict[Tuple[Optional[str], Optional[str]], Tuple[Optional[int], str]]:
+        current = {}
+        for conn in _collect_tcp_connections():
+            try:
+                status = getattr(conn, "status", "")
+                raddr = getattr(conn, "raddr", None)
+                if not _is_outgoing_established(status, raddr):
+                    continue
+                key = (_format_addr(getattr(conn, "laddr", None)), _format_addr(raddr))
+                current[key] = (getattr(conn, "pid", None), status)
+            except Exception:
+                continue
+        return current
+
+    def sample(self) -> Dict[str, List[ConnectionRecord]]:
+        now = time.time()
+        if self.use_proc:
+            current = self._current_proc(time.monotonic())
+        elif psutil:
+            current = self._current_psutil()
+        else:
+            current = {}
+
+        opened: List[ConnectionRecord] = []
+        for key, (pid, status) in current.items():
+            if key in self.open:
+                record = self.open[key]
+                if record["pid"] is None and pid is not None:
+                    # Owner resolved after the connection was first reported
+                    record["pid"] = pid
+                    record["process_name"] = self.process_name(pid)
+                continue
+            record = {
+                "pid": pid,
+                "process_name": self.process_name(pid),
+                "laddr": key[0],
+                "raddr": key[1],
+                "status": status,
+                "timestamp": now,
+                "opened_at": now,
+            }
+            self.open[key] = record
+            opened.append(record)
+
+        closed: List[ConnectionRecord] = []
+        for key in [k for k in self.open if k not in current]:
+            record = dict(self.open.pop(key))
+            record["timestamp"] = now
+            record["closed_at"] = now
+            record["duration"] = now - record["opened_at"]
+            closed.append(record)
+
+        return {"opened": opened, "closed": closed}
+
+    def connections(self) -> List[ConnectionRecord]:
+        """Connections open as of the last sample."""
+        return list(self.open.values())
+
+
+def _split_addr(addr: str) -> Tuple[str, str]:
+    host, _, port = addr.rpartition(":")
+    return host, port
+
+
+class ConnectionFeed:
+    """
+    Turns ConnectionTracker diffs into classifiable events on a background thread.
+
+    Each newly opened connection becomes an event { url, domain, timestamp,
+    pid, process_name } whose ``domain`` is the remote hostname. Addresses are
+    handed to a BackgroundResolver without waiting; a connection is held back
+    until its name is resolved (or known to be unresolvable), or for at most
+    ``max_wait`` seconds, after which it is emitted with the bare IP as the
+    domain. Events go to ``sink`` in one list per sample.
+    """
+
+    def __init__(
+        self,
+        sink: Callable[[List[Dict[str, Any]]], None],
+        resolver: Optional[BackgroundResolver] = None,
+        tracker: Optional[ConnectionTracker] = None,
+        interval: float = 1.0,
+        max_wait: float = 2.0,
+        include_loopback: bool = False,
+    ) -> None:
+        self.sink = sink
+        self.resolver = resolver or BackgroundResolver()
+        self.tracker = tracker or ConnectionTracker()
+        self.interval = interval
+        self.max_wait = max_wait
+        self.include_loopback = include_loopback
+        self._pending: List[Tuple[float, ConnectionRecord]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _wanted(self, record: ConnectionRecord) -> bool:
+        if not record.get("raddr"):
+            return False
+        if self.include_loopback:
+            return True
+        try:
+            return not ipaddress.ip_address(_split_addr(record["raddr"])[0]).is_loopback
+        except ValueError:
+            return True
+
+    def poll(self) -> List[Dict[str, Any]]:
+        """Take one sample and return the events that are ready."""
+        opened = [r for r in self.tracker.sample()["opened"] if self._wanted(r)]
+        self.resolver.submit(_split_addr(r["raddr"])[0] for r in opened)
+        now = time.monotonic()
+        self._pending.extend((now + self.max_wait, record) for record in opened)
+
+        events: List[Dict[str, Any]] = []
+        waiting: List[Tuple[float, ConnectionRecord]] = []
+        for deadline, record in self._pending:
+            ip, port = _split_addr(record["raddr"])
+            resolved, host = self.resolver.peek(ip)
+            if not resolved and now < deadline:
+                waiting.append((deadline, record))
+                continue
+            domain = host or ip
+            events.append(
+                {
+                    "url": f"tcp://{domain}:{port}",
+                    "domain": domain,
+                    "timestamp": record["opened_at"],
+                    "pid": record["pid"],
+                    "process_name": record["process_name"],
+                }
+            )
+        self._pending = waiting
+        if events:
+            self.sink(events)
+        return events
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"❌ Error sampling local connections: {e}")
+
+    def start(self) -> "ConnectionFeed":
+        self._thread = threading.Thread(target=self._run, name="connection-feed", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1.0)
+
+
 if __name__ == "__main__":
+    import argparse
     import json
-    try:
-        print(json.dumps(sample_connections(), indent=2))
-    except Exception as e:
-        print(f"Error sampling connections: {e}")
 
+    parser = argparse.ArgumentParser(description="Sample outgoing TCP connections")
+    parser.add_argument("--watch", type=float, metavar="SECONDS", help="keep sampling and print opened/closed diffs")
+    args = parser.parse_args()
 
+    if args.watch:
+        tracker = ConnectionTracker()
+        try:
+            while True:
+                diff = tracker.sample()
+                if diff["opened"] or diff["closed"]:
+                    print(json.dumps(diff), flush=True)
+                time.sleep(args.watch)
+        except KeyboardInterrupt:
+            pass
+    else:
+        try:
+            print(json.dumps(sample_connections(), indent=2))
+        except Exception as e:
+            print(f"Error sampling connections: {e}")
@@ -0,0 +1,414 @@
+import mmap
+import socket
+import struct
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np  # type: ignore
+except Exception:  # numpy is optional; record/event iteration works without it
+    np = None  # type: ignore
+
+import capture
+
+# One decoded packet: (timestamp, size, family, proto, dst_port, dst_addr)
+# family is 4/6 (0 for non-IP), dst_addr is the raw 4- or 16-byte address.
+# dst_port is None when the packet has no TCP header (non-TCP, or a fragment
+# after the first), as in capture.replay_pcap; RECORD_DTYPE stores that as 0.
+Record = Tuple[float, int, int, int, Optional[int], bytes]
+
+RECORD_DTYPE = (
+    np.dtype(
+        [
+            ("timestamp", "f8"),
+            ("size", "u4"),
+            ("dst_port", "u2"),
+            ("family", "u1"),
+            ("proto", "u1"),
+            ("dst_addr", "V16"),  # IPv4 addresses use the first 4 bytes
+        ]
+    )
+    if np is not None
+    else None
+)
+
+IPPROTO_TCP = 6
+
+_PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+_PCAPNG_SHB = 0x0A0D0D0A
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+SUPPORTED_LINKTYPES = {
+    LINKTYPE_NULL,
+    LINKTYPE_ETHERNET,
+    LINKTYPE_RAW,
+    LINKTYPE_LOOP,
+    LINKTYPE_LINUX_SLL,
+    LINKTYPE_IPV4,
+    LINKTYPE_IPV6,
+    LINKTYPE_LINUX_SLL2,
+}
+
+_VLAN_ETHERTYPES = {0x8100, 0x88A8, 0x9100}
+_IPV6_EXT_HEADERS = {0, 43, 60}  # hop-by-hop, routing, destination options
+_IPV6_FRAGMENT = 44
+
+
+class DecodeStats:
+    __slots__ = ("packets", "decoded", "skipped", "fallback")
+
+    def __init__(self) -> None:
+        self.packets = 0
+        self.decoded = 0
+        self.skipped = 0  # truncated packets or unsupported link types
+        self.fallback = False  # file was handed to scapy
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"packets": self.packets, "decoded": self.decoded, "skipped": self.skipped, "fallback": self.fallback}
+
+
+def _decode_l3(buf: Any, off: int, end: int, linktype: int) -> Optional[Tuple[int, int, Optional[int], bytes]]:
+    """Decode link, network and TCP headers at buf[off:end] -> (family, proto, dst_port, dst_addr)."""
+    if linktype == LINKTYPE_ETHERNET:
+        if end - off < 14:
+            return None
+        ethertype = (buf[off + 12] << 8) | buf[off + 13]
+        off += 14
+        while ethertype in _VLAN_ETHERTYPES and end - off >= 4:
+            ethertype = (buf[off + 2] << 8) | buf[off + 3]
+            off += 4
+        if ethertype not in (0x0800, 0x86DD):
+            return (0, 0, None, b"")
+    elif linktype == LINKTYPE_LINUX_SLL:
+        off += 16
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        off += 20
+    elif linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        off += 4
+    # RAW / IPV4 / IPV6: the packet starts with the IP header
+
+    if end - off < 20:
+        return None
+    version = buf[off] >> 4
+    if version == 4:
+        ihl = (buf[off] & 0x0F) * 4
+        if ihl < 20:
+            return None
+        proto = buf[off + 9]
+        frag_offset = ((buf[off + 6] & 0x1F) << 8) | buf[off + 7]
+        dst = buf[off + 16 : off + 20]
+        l4 = off + ihl
+        family = 4
+    elif version == 6:
+        if end - off < 40:
+            return None
+        proto = buf[off + 6]
+        dst = buf[off + 24 : off + 40]
+        l4 = off + 40
+        family = 6
+        frag_offset = 0
+        for _ in range(8):
+            if proto in _IPV6_EXT_HEADERS and end - l4 >= 2:
+                proto = buf[l4]
+                l4 += (buf[l4 + 1] + 1) * 8
+            elif proto == _IPV6_FRAGMENT and end - l4 >= 8:
+                frag_offset = ((buf[l4 + 2] << 8) | buf[l4 + 3]) >> 3
+                proto = buf[l4]
+                l4 += 8
+            else:
+                break
+    else:
+        return (0, 0, None, b"")
+
+    # Only the first fragment carries the TCP header; later ones have no port, as with scapy
+    dst_port = None
+    if proto == IPPROTO_TCP and frag_offset == 0 and end - l4 >= 4:
+        dst_port = (buf[l4 + 2] << 8) | buf[l4 + 3]
+    return (family, proto, dst_port, bytes(dst))
+
+
+class PcapDecoder:
+    """
+    Header-only decoder for pcap and pcapng files.
+
+    The file is memory-mapped and packet headers are read in place with
+    ``struct.unpack_from`` and byte indexing, so the only per-packet
+    allocation is the destination address; nothing is dissected beyond
+    Ethernet/VLAN (or SLL/raw/loopback) -> IPv4/IPv6 -> TCP destination port.
+    ``size`` is the captured length, matching capture._packet_to_event.
+
+    Files whose link type is not understood are replayed through scapy
+    (capture.replay_pcap) instead, with ``stats.fallback`` set.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.stats = DecodeStats()
+
+    # -- raw records -------------------------------------------------------
+
+    def records(self) -> Iterator[Record]:
+        with open(self.path, "rb") as fh:
+            try:
+                mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty file
+                return
+            with mm:
+                magic = mm[:4]
+                if magic in _PCAP_MAGIC:
+                    yield from self._pcap_records(mm)
+                elif len(mm) >= 12 and struct.unpack_from("<I", mm, 0)[0] == _PCAPNG_SHB:
+                    yield from self._pcapng_records(mm)
+                else:
+                    raise ValueError(f"{self.path} is not a pcap or pcapng file")
+
+    def _pcap_records(self, mm: mmap.mmap) -> Iterator[Record]:
+        endian, resolution = _PCAP_MAGIC[mm[:4]]
+        linktype = struct.unpack_from(endian + "I", mm, 20)[0] & 0x0FFFFFFF
+        if linktype not in SUPPORTED_LINKTYPES:
+            yield from self._fallback()
+            return
+        header = struct.Struct(endian + "IIII")
+        stats = self.stats
+        off = 24
+        size = len(mm)
+        while off + 16 <= size:
+            ts_sec, ts_frac, caplen, _ = header.unpack_from(mm, off)
+            off += 16
+            end = off + caplen
+            if end > size:
+                break
+            stats.packets += 1
+            decoded = _decode_l3(mm, off, end, linktype)
+            off = end
+            if decoded is None:
+                stats.skipped += 1
+                continue
+            stats.decoded += 1
+            yield (ts_sec + ts_frac * resolution, caplen) + decoded
+
+    def _pcapng_records(self, mm: mmap.mmap) -> Iterator[Record]:
+        if not self._pcapng_supported(mm):
+            yield from self._fallback()
+            return
+        stats = self.stats
+        size = len(mm)
+        off = 0
+        endian = "<"
+        interfaces: List[Tuple[int, float]] = []  # (linktype, ts resolution) per interface id
+        while off + 12 <= size:
+            block_type = struct.unpack_from(endian + "I", mm, off)[0]
+            if block_type == _PCAPNG_SHB:
+                endian = "<" if mm[off + 8 : off + 12] == b"\x4d\x3c\x2b\x1a" else ">"
+                interfaces = []
+            block_len = struct.unpack_from(endian + "I", mm, off + 4)[0]
+            if block_len < 12 or off + block_len > size:
+                break
+            if block_type == 1:  # Interface Description Block
+                linktype = struct.unpack_from(endian + "H", mm, off + 8)[0]
+                interfaces.append((linktype, _if_tsresol(mm, off + 16, off + block_len - 4, endian)))
+            elif block_type == 6:  # Enhanced Packet Block
+                if_id, ts_high, ts_low, caplen = struct.unpack_from(endian + "IIII", mm, off + 8)
+                data = off + 28
+                stats.packets += 1
+                if if_id >= len(interfaces) or interfaces[if_id][0] not in SUPPORTED_LINKTYPES:
+                    stats.skipped += 1
+                else:
+                    linktype, resolution = interfaces[if_id]
+                    decoded = _decode_l3(mm, data, min(data + caplen, off + block_len - 4), linktype)
+                    if decoded is None:
+                        stats.skipped += 1
+                    else:
+                        stats.decoded += 1
+                        yield (((ts_high << 32) | ts_low) * resolution, caplen) + decoded
+            elif block_type == 3:  # Simple Packet Block: no timestamp, interface 0
+                stats.packets += 1
+                wire_len = struct.unpack_from(endian + "I", mm, off + 8)[0]
+                caplen = min(wire_len, block_len - 16)
+                if not interfaces or interfaces[0][0] not in SUPPORTED_LINKTYPES:
+                    stats.skipped += 1
+                else:
+                    decoded = _decode_l3(mm, off + 12, off + 12 + caplen, interfaces[0][0])
+                    if decoded is None:
+                        stats.skipped += 1
+                    else:
+                        stats.decoded += 1
+                        yield (0.0, caplen) + decoded
+            off += block_len
+
+    def _pcapng_supported(self, mm: mmap.mmap) -> bool:
+        """Check the interfaces declared before the first packet; later ones are handled per packet."""
+        size = len(mm)
+        off = 0
+        endian = "<"
+        seen_interface = False
+        while off + 12 <= size:
+            block_type = struct.unpack_from(endian + "I", mm, off)[0]
+            if block_type == _PCAPNG_SHB:
+                endian = "<" if mm[off + 8 : off + 12] == b"\x4d\x3c\x2b\x1a" else ">"
+            block_len = struct.unpack_from(endian + "I", mm, off + 4)[0]
+            if block_len < 12:
+                break
+            if block_type == 1:
+                seen_interface = True
+                if struct.unpack_from(endian + "H", mm, off + 8)[0] not in SUPPORTED_LINKTYPES:
+                    return False
+            elif block_type in (2, 3, 6):
+                break
+            off += block_len
+        return seen_interface
+
+    def _fallback(self) -> Iterator[Record]:
+        self.stats.fallback = True
+        for event in capture.replay_pcap(self.path, ports=None):
+            self.stats.packets += 1
+            self.stats.decoded += 1
+            yield _event_to_record(event)
+
+    # -- consumers ---------------------------------------------------------
+
+    def events(self, ports: Optional[Tuple[int, ...]] = capture.WEB_PORTS) -> Iterator[Dict[str, Any]]:
+        """
+        Same dicts and, with ``ports``, the same packets as capture.replay_pcap:
+        { dst_ip, dst_port, size, timestamp } for IPv4/TCP to those ports, the
+        live BPF selection. With ``ports=None`` every packet is kept and IPv6
+        destinations are reported, where replay_pcap (scapy's IP layer is
+        IPv4 only) leaves ``dst_ip`` as None.
+        """
+        port_set = set(ports) if ports is not None else None
+        for ts, size, family, proto, dst_port, dst_addr in self.records():
+            if port_set is not None and (family != 4 or proto != IPPROTO_TCP or dst_port not in port_set):
+                continue
+            yield {
+                "dst_ip": format_addr(family, dst_addr),
+                "dst_port": dst_port if proto == IPPROTO_TCP else None,
+                "size": size,
+                "timestamp": ts,
+            }
+
+    def batches(self, batch_size: int = 65536, ports: Optional[Tuple[int, ...]] = capture.WEB_PORTS) -> Iterator[Any]:
+        """
+        Yield NumPy structured arrays (RECORD_DTYPE) of up to ``batch_size``
+        packets. Port filtering is applied per batch with vectorized masks.
+        """
+        if np is None:
+            raise RuntimeError("numpy is required for batched decoding")
+        columns: Tuple[List[Any], ...] = ([], [], [], [], [], [])
+        for record in self.records():
+            for column, value in zip(columns, record):
+                column.append(value)
+            if len(columns[0]) >= batch_size:
+                yield _filter_ports(_to_array(columns), ports)
+                columns = ([], [], [], [], [], [])
+        if columns[0]:
+            yield _filter_ports(_to_array(columns), ports)
+
+
+def _if_tsresol(mm: mmap.mmap, off: int, end: int, endian: str) -> float:
+    while off + 4 <= end:
+        code, length = struct.unpack_from(endian + "HH", mm, off)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            value = mm[off + 4]
+            return 2.0 ** -(value & 0x7F) if value & 0x80 else 10.0 ** -value
+        off += 4 + ((length + 3) & ~3)
+    return 1e-6
+
+
+def _event_to_record(event: Dict[str, Any]) -> Record:
+    dst_ip = event.get("dst_ip")
+    family, dst_addr = 0, b""
+    if dst_ip:
+        family = 6 if ":" in dst_ip else 4
+        dst_addr = socket.inet_pton(socket.AF_INET6 if family == 6 else socket.AF_INET, dst_ip)
+    dst_port = event.get("dst_port")
+    proto = IPPROTO_TCP if dst_port is not None else 0
+    return (event["timestamp"], event["size"], family, proto, dst_port, dst_addr)
+
+
+def _to_array(columns: Tuple[List[Any], ...]) -> Any:
+    ts, size, family, proto, dst_port, dst_addr = columns
+    arr = np.empty(len(ts), dtype=RECORD_DTYPE)
+    arr["timestamp"] = ts
+    arr["size"] = size
+    arr["family"] = family
+    arr["proto"] = proto
+    arr["dst_port"] = [0 if port is None else port for port in dst_port]
+    arr["dst_addr"] = np.frombuffer(b"".join(a.ljust(16, b"\0") for a in dst_addr), dtype="V16")
+    return arr
+
+
+def _filter_ports(arr: Any, ports: Optional[Tuple[int, ...]]) -> Any:
+    if ports is None:
+        return arr
+    mask = (arr["family"] == 4) & (arr["proto"] == IPPROTO_TCP) & np.isin(arr["dst_port"], list(ports))
+    return arr[mask]
+
+
+def format_addr(family: int, dst_addr: Any) -> Optional[str]:
+    """Render a record/array address (bytes or V16 scalar) as a string."""
+    raw = bytes(dst_addr)
+    if family == 4:
+        return socket.inet_ntop(socket.AF_INET, raw[:4])
+    if family == 6:
+        return socket.inet_ntop(socket.AF_INET6, raw[:16])
+    return None
+
+
+def aggregate_flows(batches: Iterator[Any]) -> List[Dict[str, Any]]:
+    """Total bytes/packets per (dst_ip, dst_port) over all batches, using np.unique per batch."""
+    totals: Dict[Tuple[int, bytes, int], List[int]] = {}
+    for arr in batches:
+        if len(arr) == 0:
+            continue
+        keys, inverse = np.unique(arr[["family", "dst_addr", "dst_port"]], return_inverse=True)
+        inverse = inverse.ravel()
+        nbytes = np.bincount(inverse, weights=arr["size"])
+        packets = np.bincount(inverse)
+        for key, b, p in zip(keys, nbytes, packets):
+            k = (int(key["family"]), key["dst_addr"].tobytes(), int(key["dst_port"]))
+            entry = totals.setdefault(k, [0, 0])
+            entry[0] += int(b)
+            entry[1] += int(p)
+    flows = [
+        {"dst_ip": format_addr(family, addr), "dst_port": port or None, "bytes": b, "packets": p}
+        for (family, addr, port), (b, p) in totals.items()
+    ]
+    flows.sort(key=lambda f: f["bytes"], reverse=True)
+    return flows
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Decode a pcap/pcapng file without scapy dissection")
+    parser.add_argument("pcap")
+    parser.add_argument("--all-ports", action="store_true", help="keep every packet, not just ports 80/443")
+    args = parser.parse_args()
+
+    decoder = PcapDecoder(args.pcap)
+    ports = None if args.all_ports else capture.WEB_PORTS
+    if np is not None:
+        flows = aggregate_flows(decoder.batches(ports=ports))
+    else:
+        totals: Dict[Tuple[Any, Any], List[int]] = {}
+        for event in decoder.events(ports=ports):
+            entry = totals.setdefault((event["dst_ip"], event["dst_port"]), [0, 0])
+            entry[0] += event["size"]
+            entry[1] += 1
+        flows = [{"dst_ip": ip, "dst_port": port, "bytes": b, "packets": p} for (ip, port), (b, p) in totals.items()]
+        flows.sort(key=lambda f: f["bytes"], reverse=True)
+    print(json.dumps({"flows": flows[:50], "stats": decoder.stats.as_dict()}, indent=2))
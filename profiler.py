@@ -0,0 +1,98 @@
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional, Set
+
+DEFAULT_INTERVAL = 0.005
+
+
+class SamplingProfiler:
+    """
+    Low-overhead wall-clock profiler: a background thread snapshots the
+    stacks of the profiled threads every ``interval`` seconds via
+    ``sys._current_frames`` and counts identical stacks.
+
+    Nothing is hooked into the interpreter, so the profiled code runs at full
+    speed apart from the sampler thread's share of the GIL. ``dump`` writes
+    collapsed stacks ("outer;inner;leaf count" per line), which flamegraph.pl
+    and speedscope read directly.
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, thread_ids: Optional[Set[int]] = None) -> None:
+        self.interval = interval
+        self.thread_ids = thread_ids
+        self.stacks: "Counter[str]" = Counter()
+        self.samples = 0
+        self.started_at = 0.0
+        self.stopped_at = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(names))] += 1
+                self.samples += 1
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> "SamplingProfiler":
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.stopped_at = time.time()
+        return self
+
+    def dump(self, directory: str, label: str = "profile") -> str:
+        """Write collapsed stacks to ``directory`` and return the file path."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{label}-{os.getpid()}-{int(self.started_at * 1000)}.folded")
+        with open(path, "w") as fh:
+            for stack, count in self.stacks.most_common():
+                fh.write(f"{stack} {count}\n")
+        return path
+
+
+def install_signal_toggle(signum: int, directory: str, interval: float = DEFAULT_INTERVAL) -> None:
+    """
+    Make ``signum`` toggle a whole-process SamplingProfiler: the first signal
+    starts it, the next stops it and writes the profile to ``directory``.
+
+    Must be called from the main thread (a Python signal handler requirement).
+    """
+    state = {"profiler": None}
+
+    def toggle(_signum, _frame):
+        profiler = state["profiler"]
+        if profiler is None:
+            state["profiler"] = SamplingProfiler(interval).start()
+            print(f"🔬 Profiling started (pid {os.getpid()})")
+        else:
+            state["profiler"] = None
+            # Stop and write from a thread: joining the sampler inside a signal handler could stall the interrupted frame
+            def finish():
+                path = profiler.stop().dump(directory)
+                print(f"🔬 Profile written to {path} ({profiler.samples} samples)")
+
+            threading.Thread(target=finish, daemon=True).start()
+
+    signal.signal(signum, toggle)
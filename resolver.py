@@ -0,0 +1,361 @@
+import asyncio
+import ipaddress
+import random
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+Lookup = Callable[[str], Awaitable[Optional[str]]]
+
+_DNS_TYPE_PTR = 12
+_DNS_CLASS_IN = 1
+_DNS_RCODE_NXDOMAIN = 3
+_HTTP_METHODS = (b"GET ", b"POST ", b"PUT ", b"HEAD ", b"DELETE ", b"OPTIONS ", b"PATCH ", b"CONNECT ")
+
+
+async def system_lookup(ip: str) -> Optional[str]:
+    """Reverse lookup through the OS resolver (getnameinfo in the loop's executor)."""
+    loop = asyncio.get_running_loop()
+    try:
+        host, _ = await loop.getnameinfo((ip, 0), socket.NI_NAMEREQD)
+    except (socket.gaierror, socket.herror, UnicodeError):
+        return None
+    return host
+
+
+def _encode_name(name: str) -> bytes:
+    out = b""
+    for label in name.rstrip(".").split("."):
+        out += bytes((len(label),)) + label.encode("ascii")
+    return out + b"\x00"
+
+
+def _decode_name(msg: bytes, off: int) -> Tuple[str, int]:
+    """Read a possibly compressed name at ``off``; returns (name, offset after it)."""
+    labels = []
+    end = None
+    for _ in range(128):  # bounds pointer loops in malformed replies
+        length = msg[off]
+        if length == 0:
+            off += 1
+            break
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = off + 2
+            off = struct.unpack_from("!H", msg, off)[0] & 0x3FFF
+            continue
+        labels.append(msg[off + 1 : off + 1 + length].decode("ascii", "replace"))
+        off += 1 + length
+    else:
+        raise ValueError("DNS name too long")
+    return ".".join(labels), end if end is not None else off
+
+
+def _parse_ptr_reply(msg: bytes, query_id: int) -> Optional[str]:
+    try:
+        return _parse_ptr_answer(msg, query_id)
+    except (struct.error, IndexError) as e:  # truncated or malformed reply
+        raise ValueError(f"malformed DNS reply: {e}") from e
+
+
+def _parse_ptr_answer(msg: bytes, query_id: int) -> Optional[str]:
+    reply_id, flags, qdcount, ancount = struct.unpack_from("!HHHH", msg, 0)
+    if reply_id != query_id:
+        raise ValueError("DNS reply id mismatch")
+    if flags & 0xF == _DNS_RCODE_NXDOMAIN:
+        return None
+    off = 12
+    for _ in range(qdcount):
+        _, off = _decode_name(msg, off)
+        off += 4
+    for _ in range(ancount):
+        _, off = _decode_name(msg, off)
+        rtype, rclass, _, rdlength = struct.unpack_from("!HHIH", msg, off)
+        off += 10
+        if rtype == _DNS_TYPE_PTR and rclass == _DNS_CLASS_IN:
+            return _decode_name(msg, off)[0] or None
+        off += rdlength
+    return None
+
+
+class _DatagramReply(asyncio.DatagramProtocol):
+    def __init__(self, future: "asyncio.Future[bytes]") -> None:
+        self.future = future
+
+    def datagram_received(self, data: bytes, addr: Any) -> None:
+        if not self.future.done():
+            self.future.set_result(data)
+
+    def error_received(self, exc: Exception) -> None:
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+
+class DnsPtrLookup:
+    """
+    Reverse lookups sent straight to one DNS server over UDP.
+
+    Unlike system_lookup this does not occupy an executor thread per query, so
+    hundreds can be in flight at once, and pointing ``server`` at a local stub
+    (e.g. ("127.0.0.1", 5353)) makes the resolver testable offline.
+    """
+
+    def __init__(self, server: Tuple[str, int] = ("127.0.0.53", 53), timeout: float = 2.0) -> None:
+        self.server = server
+        self.timeout = timeout
+
+    async def __call__(self, ip: str) -> Optional[str]:
+        query_id = random.getrandbits(16)
+        name = ipaddress.ip_address(ip).reverse_pointer
+        query = struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0)
+        query += _encode_name(name) + struct.pack("!HH", _DNS_TYPE_PTR, _DNS_CLASS_IN)
+
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[bytes]" = loop.create_future()
+        transport, _ = await loop.create_datagram_endpoint(lambda: _DatagramReply(future), remote_addr=self.server)
+        try:
+            transport.sendto(query)
+            reply = await asyncio.wait_for(future, self.timeout)
+        finally:
+            transport.close()
+        return _parse_ptr_reply(reply, query_id)
+
+
+class _TTLCache:
+    """Bounded LRU of ip -> (hostname or None, expiry); safe to use from any thread."""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, ip: str, now: float) -> Tuple[bool, Optional[str]]:
+        with self._lock:
+            entry = self._entries.get(ip)
+            if entry is None:
+                return False, None
+            if entry[1] <= now:
+                del self._entries[ip]
+                return False, None
+            self._entries.move_to_end(ip)
+            return True, entry[0]
+
+    def put(self, ip: str, host: Optional[str], expires: float) -> None:
+        with self._lock:
+            self._entries[ip] = (host, expires)
+            self._entries.move_to_end(ip)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class HostnameResolver:
+    """
+    Cached, batched IP -> hostname resolution for capture and monitor records.
+
+    ``resolve_many`` looks up every uncached address concurrently, at most
+    ``concurrency`` at a time, and concurrent requests for the same address
+    share one lookup. Results, including failures, are kept in a bounded LRU:
+    hostnames for ``positive_ttl`` seconds and misses for ``negative_ttl``, so
+    unresolvable addresses are not retried on every sample. Names seen on the
+    wire (TLS SNI, HTTP Host) can be fed in with ``learn``; they win over PTR
+    records, which often name a CDN node rather than the site.
+
+    ``lookup`` is any coroutine function ``ip -> hostname or None``:
+    system_lookup (the default), a DnsPtrLookup, or a stub. The coroutine
+    methods must run on a single event loop; ``cached`` and ``learn`` may be
+    called from any thread and never block on the network.
+    """
+
+    def __init__(
+        self,
+        lookup: Optional[Lookup] = None,
+        concurrency: int = 32,
+        cache_size: int = 65536,
+        positive_ttl: float = 3600.0,
+        negative_ttl: float = 300.0,
+        timeout: float = 2.0,
+    ) -> None:
+        self.lookup = lookup or system_lookup
+        self.concurrency = concurrency
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self._cache = _TTLCache(cache_size)
+        self._inflight: Dict[str, "asyncio.Future[Optional[str]]"] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.hits = 0
+        self.misses = 0
+        self.lookups = 0
+        self.failures = 0
+
+    def cached(self, ip: str) -> Optional[str]:
+        """Hostname for ``ip`` if it is cached, else None; never starts a lookup."""
+        return self._cache.get(ip, time.monotonic())[1]
+
+    def peek(self, ip: str) -> Tuple[bool, Optional[str]]:
+        """(resolved, hostname): unlike ``cached``, tells a cached miss from "not looked up yet"."""
+        return self._cache.get(ip, time.monotonic())
+
+    def learn(self, ip: str, host: str) -> None:
+        """Record a hostname observed in traffic (SNI, Host header) for ``ip``."""
+        if ip and host:
+            self._cache.put(ip, host.lower().rstrip("."), time.monotonic() + self.positive_ttl)
+
+    async def _lookup(self, ip: str) -> Optional[str]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            # learn() may have filled the entry while this lookup was queued
+            found, host = self._cache.get(ip, time.monotonic())
+            if found:
+                return host
+            self.lookups += 1
+            try:
+                host = await asyncio.wait_for(self.lookup(ip), self.timeout)
+            except (asyncio.TimeoutError, OSError, ValueError):
+                self.failures += 1
+                host = None
+        now = time.monotonic()
+        found, learned = self._cache.get(ip, now)
+        if found and learned:  # learn() ran while the lookup was in flight; keep the observed name
+            return learned
+        self._cache.put(ip, host, now + (self.positive_ttl if host else self.negative_ttl))
+        return host
+
+    async def resolve(self, ip: str) -> Optional[str]:
+        found, host = self._cache.get(ip, time.monotonic())
+        if found:
+            self.hits += 1
+            return host
+        self.misses += 1
+        future = self._inflight.get(ip)
+        if future is None:
+            future = asyncio.ensure_future(self._lookup(ip))
+            self._inflight[ip] = future
+            future.add_done_callback(lambda _: self._inflight.pop(ip, None))
+        # shield: one caller being cancelled must not cancel the lookup others wait on
+        return await asyncio.shield(future)
+
+    async def resolve_many(self, ips: Iterable[str]) -> Dict[str, Optional[str]]:
+        unique = list(dict.fromkeys(ip for ip in ips if ip))
+        hosts = await asyncio.gather(*(self.resolve(ip) for ip in unique))
+        return dict(zip(unique, hosts))
+
+    def cache_info(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "lookups": self.lookups,
+            "failures": self.failures,
+            "size": len(self._cache),
+            "inflight": len(self._inflight),
+        }
+
+
+def _log_failure(future: Any) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        print(f"❌ Hostname resolution failed: {future.exception()}")
+
+
+class BackgroundResolver:
+    """
+    Runs a HostnameResolver on its own event-loop thread for synchronous code.
+
+    ``submit`` queues addresses and returns immediately, so a sampler or a
+    request handler can ask for names without waiting; the answers show up
+    in ``cached`` once resolved.
+    """
+
+    def __init__(self, resolver: Optional[HostnameResolver] = None) -> None:
+        self.resolver = resolver or HostnameResolver()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="hostname-resolver", daemon=True)
+        self._thread.start()
+
+    def cached(self, ip: str) -> Optional[str]:
+        return self.resolver.cached(ip)
+
+    def peek(self, ip: str) -> Tuple[bool, Optional[str]]:
+        return self.resolver.peek(ip)
+
+    def learn(self, ip: str, host: str) -> None:
+        self.resolver.learn(ip, host)
+
+    def submit(self, ips: Iterable[str]) -> None:
+        pending = [ip for ip in ips if ip and not self.resolver.peek(ip)[0]]
+        if pending:
+            future = asyncio.run_coroutine_threadsafe(self.resolver.resolve_many(pending), self._loop)
+            future.add_done_callback(_log_failure)
+
+    def resolve_many(self, ips: Iterable[str], timeout: Optional[float] = None) -> Dict[str, Optional[str]]:
+        """Blocking batch resolve, for scripts and the CLI."""
+        future = asyncio.run_coroutine_threadsafe(self.resolver.resolve_many(list(ips)), self._loop)
+        return future.result(timeout)
+
+    def close(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=1.0)
+
+
+def _tls_server_name(payload: bytes) -> Optional[str]:
+    # TLS record header (5) + handshake header (4) + client version (2) + random (32)
+    off = 43
+    off += 1 + payload[off]  # session id
+    off += 2 + struct.unpack_from("!H", payload, off)[0]  # cipher suites
+    off += 1 + payload[off]  # compression methods
+    end = min(len(payload), off + 2 + struct.unpack_from("!H", payload, off)[0])
+    off += 2
+    while off + 4 <= end:
+        ext_type, ext_len = struct.unpack_from("!HH", payload, off)
+        off += 4
+        if ext_type == 0:  # server_name: list length (2), name type (1), name length (2), name
+            if payload[off + 2] != 0:
+                return None
+            name_len = struct.unpack_from("!H", payload, off + 3)[0]
+            return payload[off + 5 : off + 5 + name_len].decode("ascii") or None
+        off += ext_len
+    return None
+
+
+def _http_host(payload: bytes) -> Optional[str]:
+    head = payload.split(b"\r\n\r\n", 1)[0]
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"host":
+            host = value.strip().decode("ascii")
+            if host.startswith("["):
+                return host[1 : host.find("]")] or None
+            return host.split(":", 1)[0] or None
+    return None
+
+
+def server_name_from_payload(payload: bytes) -> Optional[str]:
+    """
+    Hostname a client asked for in the first bytes of a TCP stream: the SNI
+    of a TLS ClientHello or the Host header of a plain HTTP request.
+    Returns None for anything else, including truncated packets.
+    """
+    try:
+        if len(payload) > 43 and payload[0] == 0x16 and payload[1] == 0x03 and payload[5] == 0x01:
+            host = _tls_server_name(payload)
+        elif payload.startswith(_HTTP_METHODS):
+            host = _http_host(payload)
+        else:
+            return None
+    except (IndexError, struct.error, UnicodeDecodeError):
+        return None
+    return host.lower().rstrip(".") if host else None
+
+
+def learn_from_events(resolver: Any, events: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Pass capture events through, teaching ``resolver`` every dst_ip -> server_name seen."""
+    for event in events:
+        if event.get("server_name") and event.get("dst_ip"):
+            resolver.learn(event["dst_ip"], event["server_name"])
+        yield event
@@ -0,0 +1,327 @@
+import os
+import re
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+SAFE = "Safe"
+RISK = "Risk"
+CAUTION = "Caution"
+
+_TRUSTED = 1
+_RISKY = 2
+
+_HOSTS_ADDRESSES = {"0.0.0.0", "127.0.0.1", "::", "::1", "0", "255.255.255.255"}
+_HOSTS_IGNORED = {"localhost", "localhost.localdomain", "local", "broadcasthost", "ip6-localhost", "ip6-loopback"}
+_DOMAIN_RE = re.compile(r"^[a-z0-9_-]+(\.[a-z0-9_-]+)+$")
+
+
+class _SuffixTrie:
+    """
+    Domain-suffix matcher keyed on reversed labels.
+
+    "ads.example.com" is stored as com -> example -> ads, so a lookup costs one
+    dict probe per label of the queried domain regardless of the rule count.
+    A rule matches the domain itself and every subdomain below it.
+    """
+
+    __slots__ = ("_root", "size")
+
+    def __init__(self, domains: Iterable[str] = ()) -> None:
+        self._root: Dict[Optional[str], dict] = {}
+        self.size = 0
+        for domain in domains:
+            self.add(domain)
+
+    def add(self, domain: str) -> None:
+        labels = domain.strip(".").lower().split(".")
+        if not labels or not all(labels):
+            return
+        node = self._root
+        for label in reversed(labels):
+            node = node.setdefault(label, {})
+        if None not in node:
+            node[None] = {}
+            self.size += 1
+
+    def matches(self, domain: str) -> bool:
+        node = self._root
+        if not node:
+            return False
+        for label in reversed(domain.rstrip(".").split(".")):
+            node = node.get(label)  # type: ignore[assignment]
+            if node is None:
+                return False
+            if None in node:
+                return True
+        return False
+
+
+class _KeywordAutomaton:
+    """
+    Aho-Corasick automaton over substring rules.
+
+    Each pattern carries a category bit; ``scan`` returns the OR of the bits of
+    every pattern occurring anywhere in the text, which is exactly what the
+    old ``pattern in domain`` loop computed, in one pass over the text.
+    """
+
+    __slots__ = ("_goto", "_fail", "_out", "size")
+
+    def __init__(self, patterns: Iterable[Tuple[str, int]] = ()) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._out: List[int] = [0]
+        self.size = 0
+        for pattern, bit in patterns:
+            self._insert(pattern, bit)
+        self._fail: List[int] = [0] * len(self._goto)
+        self._build()
+
+    def _insert(self, pattern: str, bit: int) -> None:
+        if not pattern:
+            return
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._out.append(0)
+                self._goto[state][ch] = nxt
+            state = nxt
+        if not self._out[state] & bit:
+            self.size += 1
+        self._out[state] |= bit
+
+    def _build(self) -> None:
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[nxt] = target if target != nxt else 0
+                out[nxt] |= out[fail[nxt]]
+
+    def scan(self, text: str, stop_mask: int = 0) -> int:
+        if self.size == 0:
+            return 0
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        found = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found |= out[state]
+                if found & stop_mask:
+                    break
+        return found
+
+
+class RuleSet:
+    """
+    Compiled, immutable set of classification rules.
+
+    Keyword rules match anywhere in the domain (the semantics of the built-in
+    TRUST_CONFIG lists); domain rules match a domain and its subdomains (the
+    semantics of hosts files and ``||domain^`` blocklist entries). Trusted
+    rules win over risky ones, as before.
+    """
+
+    def __init__(
+        self,
+        trusted_keywords: Iterable[str] = (),
+        risky_keywords: Iterable[str] = (),
+        trusted_domains: Iterable[str] = (),
+        risky_domains: Iterable[str] = (),
+    ) -> None:
+        patterns = [(p.lower(), _TRUSTED) for p in trusted_keywords]
+        patterns += [(p.lower(), _RISKY) for p in risky_keywords]
+        self._keywords = _KeywordAutomaton(patterns)
+        self._trusted_domains = _SuffixTrie(trusted_domains)
+        self._risky_domains = _SuffixTrie(risky_domains)
+
+    @property
+    def rule_count(self) -> int:
+        return self._keywords.size + self._trusted_domains.size + self._risky_domains.size
+
+    def classify(self, domain_lower: str) -> str:
+        found = self._keywords.scan(domain_lower, stop_mask=_TRUSTED)
+        if found & _TRUSTED or self._trusted_domains.matches(domain_lower):
+            return SAFE
+        if found & _RISKY or self._risky_domains.matches(domain_lower):
+            return RISK
+        return CAUTION
+
+
+def parse_rules(lines: Iterable[str]) -> Tuple[List[str], List[str]]:
+    """
+    Parse a rules file into (domains, keywords).
+
+    Understands the formats real blocklists ship in:
+      - hosts files:      "0.0.0.0 ads.example.com"
+      - adblock domains:  "||ads.example.com^" (options after "$" ignored)
+      - plain domains:    "ads.example.com"
+      - keyword rules:    "*tracking*" (substring match, like TRUST_CONFIG)
+    Comments ("#", "!"), exception rules ("@@") and cosmetic/URL-path rules
+    that cannot be evaluated against a bare domain are skipped.
+    """
+    domains: List[str] = []
+    keywords: List[str] = []
+    for raw in lines:
+        line = raw.strip()
+        if not line or line[0] in "#![":
+            continue
+        if line.startswith("@@") or "##" in line or "#@#" in line or "#?#" in line:
+            continue
+        if line.startswith("||"):
+            rule = line[2:].split("$", 1)[0]
+            if rule.endswith("^"):
+                rule = rule[:-1]
+            rule = rule.lower()
+            if _DOMAIN_RE.match(rule):
+                domains.append(rule)
+            continue
+        if len(line) > 2 and line[0] == "*" and line[-1] == "*":
+            keyword = line[1:-1].strip().lower()
+            if keyword and "*" not in keyword:
+                keywords.append(keyword)
+            continue
+        tokens = line.split("#", 1)[0].split()
+        if not tokens:
+            continue
+        if tokens[0] in _HOSTS_ADDRESSES:
+            tokens = tokens[1:]
+        for token in tokens:
+            token = token.lower().rstrip(".")
+            if token not in _HOSTS_IGNORED and _DOMAIN_RE.match(token):
+                domains.append(token)
+    return domains, keywords
+
+
+def load_rules_file(path: str) -> Tuple[List[str], List[str]]:
+    with open(path, "r", encoding="utf-8", errors="replace") as fh:
+        return parse_rules(fh)
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class RuleEngine:
+    """
+    Domain classifier backed by a compiled RuleSet and an LRU verdict cache.
+
+    The built-in keyword lists are always loaded; rule files are merged on top
+    and re-read when their mtime changes, checked every ``reload_interval``
+    seconds by a daemon thread (restarted in forked workers), so a large
+    blocklist is never parsed on a request thread. A reload compiles the new
+    RuleSet off to the side and swaps it in together with a fresh cache, so
+    concurrent callers never see a half-built matcher.
+    """
+
+    def __init__(
+        self,
+        trusted: Sequence[str] = (),
+        risky: Sequence[str] = (),
+        trusted_files: Sequence[str] = (),
+        risky_files: Sequence[str] = (),
+        cache_size: int = 65536,
+        reload_interval: float = 5.0,
+    ) -> None:
+        self._builtin_trusted = list(trusted)
+        self._builtin_risky = list(risky)
+        self._trusted_files = list(trusted_files)
+        self._risky_files = list(risky_files)
+        self._cache_size = cache_size
+        self._reload_interval = reload_interval
+        self._reload_lock = threading.Lock()
+        self._mtimes: Dict[str, Optional[float]] = {}
+        self._stop = threading.Event()
+        self._retired_hits = 0  # totals of caches replaced by reloads
+        self._retired_misses = 0
+        self.ruleset = RuleSet()
+        self._classify: Callable[[str], str] = self.ruleset.classify
+        self.reload()
+        if self._trusted_files or self._risky_files:
+            self._start_watcher()
+            os.register_at_fork(after_in_child=self._start_watcher)
+
+    def _file_mtimes(self) -> Dict[str, Optional[float]]:
+        return {path: _mtime(path) for path in self._trusted_files + self._risky_files}
+
+    def _load(self, paths: Sequence[str]) -> Tuple[List[str], List[str]]:
+        domains: List[str] = []
+        keywords: List[str] = []
+        for path in paths:
+            try:
+                file_domains, file_keywords = load_rules_file(path)
+            except OSError as e:
+                print(f"⚠️ Could not load rules from {path}: {e}")
+                continue
+            domains.extend(file_domains)
+            keywords.extend(file_keywords)
+        return domains, keywords
+
+    def reload(self) -> None:
+        """Recompile the rule set from the built-in lists and rule files."""
+        with self._reload_lock:
+            mtimes = self._file_mtimes()
+            trusted_domains, trusted_keywords = self._load(self._trusted_files)
+            risky_domains, risky_keywords = self._load(self._risky_files)
+            ruleset = RuleSet(
+                trusted_keywords=self._builtin_trusted + trusted_keywords,
+                risky_keywords=self._builtin_risky + risky_keywords,
+                trusted_domains=trusted_domains,
+                risky_domains=risky_domains,
+            )
+            # Publish the rule set and its cache in one assignment each; readers
+            # only ever touch ``self._classify``.
+            retired = self._classify
+            self.ruleset = ruleset
+            self._classify = lru_cache(maxsize=self._cache_size)(ruleset.classify)
+            self._mtimes = mtimes
+            if hasattr(retired, "cache_info"):
+                info = retired.cache_info()
+                self._retired_hits += info.hits
+                self._retired_misses += info.misses
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self._reload_interval):
+            try:
+                if self._file_mtimes() != self._mtimes:
+                    self.reload()
+            except Exception as e:
+                print(f"⚠️ Could not reload rules: {e}")
+
+    def _start_watcher(self) -> None:
+        threading.Thread(target=self._watch, name="rules-reload", daemon=True).start()
+
+    def close(self) -> None:
+        """Stop watching the rule files."""
+        self._stop.set()
+
+    def classify(self, domain: str) -> str:
+        """Classify domain as Safe/Risk/Caution"""
+        if not domain:
+            return CAUTION
+        return self._classify(domain.lower())
+
+    def cache_info(self):
+        """lru_cache statistics of the current cache; they start over on every reload."""
+        return self._classify.cache_info()  # type: ignore[attr-defined]
+
+    def cache_totals(self) -> Tuple[int, int]:
+        """(hits, misses) since the engine was created, across reloads."""
+        info = self.cache_info()
+        return self._retired_hits + info.hits, self._retired_misses + info.misses
@@ -0,0 +1,111 @@
+import hashlib
+import heapq
+import math
+from typing import Dict, List, Tuple
+
+
+def hash_value(value: str) -> int:
+    # Stable across processes (unlike hash()), so a rebuilt sketch matches the original
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8", "surrogatepass"), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """
+    Distinct-count estimate in ``2**precision`` one-byte registers.
+
+    The default precision 14 uses 16 KiB whatever the number of distinct
+    values, with a standard error of about 1.04 / sqrt(2**14), i.e. ~0.8%.
+    Small cardinalities use linear counting, which is close to exact.
+    """
+
+    __slots__ = ("precision", "_registers")
+
+    def __init__(self, precision: int = 14) -> None:
+        if not 4 <= precision <= 18:
+            raise ValueError("precision must be between 4 and 18")
+        self.precision = precision
+        self._registers = bytearray(1 << precision)
+
+    def add(self, value: str) -> None:
+        self.add_hash(hash_value(value))
+
+    def add_hash(self, h: int) -> None:
+        """Add a value by its 64-bit hash (see ``hash_value``), to hash once for several sketches."""
+        p = self.precision
+        index = h >> (64 - p)
+        rest = h & ((1 << (64 - p)) - 1)
+        # Rank: position of the leftmost 1-bit in the remaining 64 - p bits
+        rank = (64 - p) - rest.bit_length() + 1
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.precision != self.precision:
+            raise ValueError("cannot merge HyperLogLogs of different precision")
+        self._registers = bytearray(map(max, self._registers, other._registers))
+
+    def count(self) -> int:
+        m = len(self._registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self._registers)
+        zeros = self._registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def __len__(self) -> int:
+        return self.count()
+
+
+class SpaceSaving:
+    """
+    Heavy-hitters sketch (Metwally et al.) holding at most ``capacity`` counters.
+
+    Every item whose true count exceeds total / capacity is guaranteed to be
+    tracked. A reported count overestimates the true count by at most its
+    ``error``: when a new item arrives while the sketch is full it takes
+    over the smallest counter, inheriting that counter's value as its error.
+
+    The smallest counter is found through a min-heap that is not updated on
+    increments: each tracked item has one heap entry holding a count that may
+    be stale (too low). When popping, a stale entry is pushed back with its
+    current count, so eviction is O(log capacity) amortized.
+    """
+
+    __slots__ = ("capacity", "_counts", "_heap", "total")
+
+    def __init__(self, capacity: int = 200) -> None:
+        self.capacity = capacity
+        self._counts: Dict[str, List[int]] = {}  # item -> [count, error]
+        self._heap: List[Tuple[int, str]] = []  # (count when pushed, item)
+        self.total = 0
+
+    def _pop_min(self) -> Tuple[str, int]:
+        heap = self._heap
+        while True:
+            count, item = heapq.heappop(heap)
+            current = self._counts[item][0]
+            if current == count:
+                del self._counts[item]
+                return item, count
+            heapq.heappush(heap, (current, item))
+
+    def add(self, item: str, count: int = 1) -> None:
+        self.total += count
+        entry = self._counts.get(item)
+        if entry is not None:
+            entry[0] += count
+            return
+        error = 0
+        if len(self._counts) >= self.capacity:
+            _, error = self._pop_min()
+        self._counts[item] = [error + count, error]
+        heapq.heappush(self._heap, (error + count, item))
+
+    def top(self, k: int) -> List[Tuple[str, int, int]]:
+        """The ``k`` largest counters as (item, count, error), largest first."""
+        ranked = sorted(self._counts.items(), key=lambda kv: kv[1][0], reverse=True)[:k]
+        return [(item, count, error) for item, (count, error) in ranked]
+
+    def __len__(self) -> int:
+        return len(self._counts)
@@ -21,7 +21,12 @@ document.addEventListener("DOMContentLoaded", () => {
     `;
   }
   
+  const MAX_RESULTS = 50;
+  let currentEvents = [];
+  let liveSource = null;   // EventSource, or interval id when polling
+  
   function startScan() {
+    stopLiveUpdates();
     document.getElementById("scanAgainBtn").classList.add("hidden");
     const screen = document.getElementById("screen");
     screen.innerHTML = getScanningHTML();
@@ -32,16 +37,69 @@ document.addEventListener("DOMContentLoaded", () => {
   
   async function fetchResults() {
     try {
-      const res = await fetch("/api/events?n=50");
+      const res = await fetch(`/api/events?n=${MAX_RESULTS}`);
       if (!res.ok) throw new Error("Network response was not ok");
       const data = await res.json();
-      renderResults(data.events || []);
+      currentEvents = data.events || [];
+      renderResults(currentEvents);
+      startLiveUpdates(data.last_seq ?? -1);
     } catch (err) {
       console.error(err);
       renderResults([], "Unable to reach server.");
     }
   }
   
+  // Merge a delta (newest first) into the rendered list
+  function applyDelta(data) {
+    const incoming = data.events || [];
+    if (!data.truncated && incoming.length === 0) return;
+    currentEvents = (data.truncated ? incoming : incoming.concat(currentEvents)).slice(0, MAX_RESULTS);
+    renderResults(currentEvents);
+  }
+  
+  // Receive only new events: server push when available, cursor polling otherwise
+  function startLiveUpdates(lastSeq) {
+    if (window.EventSource) {
+      const source = new EventSource(`/api/stream?since=${lastSeq}`);
+      source.addEventListener("events", (e) => {
+        const data = JSON.parse(e.data);
+        lastSeq = data.last_seq;
+        applyDelta(data);
+      });
+      // A dropped or expired stream reconnects by itself and resumes via Last-Event-ID; only a
+      // refusal (503 past the stream cap or on a sync worker) closes it, then poll from where it stopped
+      source.onerror = () => {
+        if (liveSource !== source || source.readyState !== EventSource.CLOSED) return;
+        startPolling(lastSeq);
+      };
+      liveSource = source;
+      return;
+    }
+    startPolling(lastSeq);
+  }
+  
+  function startPolling(lastSeq) {
+    let cursor = lastSeq;
+    liveSource = setInterval(async () => {
+      try {
+        const res = await fetch(`/api/events?since=${cursor}`);
+        if (!res.ok) return;
+        const data = await res.json();
+        cursor = data.last_seq;
+        applyDelta(data);
+      } catch (err) {
+        console.error(err);
+      }
+    }, 2000);
+  }
+  
+  function stopLiveUpdates() {
+    if (liveSource === null) return;
+    if (typeof liveSource.close === "function") liveSource.close();
+    else clearInterval(liveSource);
+    liveSource = null;
+  }
+  
   function renderResults(events, errorMsg) {
     const screen = document.getElementById("screen");
     let html = `
@@ -0,0 +1,277 @@
+import sys
+import threading
+import time
+from collections import deque
+from itertools import islice
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional
+
+from sketches import HyperLogLog, SpaceSaving, hash_value
+
+Event = Dict[str, Any]
+
+# Fields kept from a client-supplied event; anything else is dropped on ingest.
+EVENT_FIELDS = ("url", "method", "status", "timestamp", "server_timestamp", "domain", "verdict", "type")
+# Low-cardinality fields whose strings are interned and shared between records.
+_INTERNED_FIELDS = ("method", "status", "domain", "verdict", "type")
+
+
+def numeric_timestamp(ts: Any) -> float:
+    if isinstance(ts, (int, float)) and not isinstance(ts, bool):
+        return ts
+    return 0
+
+
+def event_timestamp(event: Event) -> float:
+    return numeric_timestamp(event.get("timestamp", 0))
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if type(value) is str else value
+
+
+class EventRecord:
+    """
+    Compact in-memory form of a stored event.
+
+    Only EVENT_FIELDS are kept, in slots rather than a per-event dict, and the
+    repetitive strings (domain, verdict, type, ...) are interned. The session
+    id is implied by the owning session; ``seq`` is assigned by it on append.
+    ``to_dict`` rebuilds the API shape when the event is serialized.
+    """
+
+    __slots__ = EVENT_FIELDS + ("seq",)
+
+    def __init__(self, event: Event) -> None:
+        self.seq = 0
+        for field in EVENT_FIELDS:
+            value = event.get(field)
+            setattr(self, field, _intern(value) if field in _INTERNED_FIELDS else value)
+
+    def to_dict(self, session_id: str) -> Event:
+        event = {field: getattr(self, field) for field in EVENT_FIELDS}
+        event = {k: v for k, v in event.items() if v is not None}
+        event["session_id"] = session_id
+        event["seq"] = self.seq
+        return event
+
+    def nbytes(self) -> int:
+        """Estimated memory held by this record (interned strings are shared, not counted)."""
+        url = self.url
+        return _RECORD_BYTES + (sys.getsizeof(url) if isinstance(url, str) else 64)
+
+
+# Slot object + two float timestamps + the deque slot pointing at it.
+_RECORD_BYTES = sys.getsizeof(EventRecord({})) + 2 * sys.getsizeof(0.0) + 8
+
+
+class SessionStats:
+    """
+    Running aggregate over the events currently retained for one session.
+
+    ``add``/``remove`` are O(1) amortized, so the stats endpoint can answer
+    without walking the event list:
+      - verdict counters are plain integers;
+      - unique domains are tracked as refcounts, a domain disappears only
+        when its last retained event is evicted;
+      - last_activity is a sliding-window maximum. Events leave in arrival
+        order, so a monotonic deque of (seq, timestamp) candidates is enough
+        to keep the exact maximum of the retained window.
+    """
+
+    __slots__ = ("total", "verdicts", "domains", "_max_window")
+
+    def __init__(self) -> None:
+        self.total = 0
+        self.verdicts: Dict[str, int] = {"Safe": 0, "Risk": 0, "Caution": 0}
+        self.domains: Dict[str, int] = {}
+        self._max_window: Deque = deque()
+
+    def add(self, record: EventRecord) -> None:
+        self.total += 1
+        verdict = record.verdict
+        if verdict is not None:
+            self.verdicts[verdict] = self.verdicts.get(verdict, 0) + 1
+        domain = record.domain
+        if domain:
+            self.domains[domain] = self.domains.get(domain, 0) + 1
+
+        ts = numeric_timestamp(record.timestamp)
+        window = self._max_window
+        while window and window[-1][1] <= ts:
+            window.pop()
+        window.append((record.seq, ts))
+
+    def remove(self, record: EventRecord) -> None:
+        """Un-count the oldest retained event (events must leave in FIFO order)."""
+        self.total -= 1
+        verdict = record.verdict
+        if verdict is not None:
+            self.verdicts[verdict] -= 1
+        domain = record.domain
+        if domain:
+            refs = self.domains[domain] - 1
+            if refs:
+                self.domains[domain] = refs
+            else:
+                del self.domains[domain]
+
+        window = self._max_window
+        if window and window[0][0] == record.seq:
+            window.popleft()
+
+    @property
+    def last_activity(self) -> float:
+        return self._max_window[0][1] if self._max_window else 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "total_requests": self.total,
+            "safe_count": self.verdicts.get("Safe", 0),
+            "risk_count": self.verdicts.get("Risk", 0),
+            "caution_count": self.verdicts.get("Caution", 0),
+            "unique_domains": len(self.domains),
+            "last_activity": self.last_activity,
+        }
+
+
+class SessionEvents:
+    """
+    Bounded per-session buffer of EventRecords that keeps its SessionStats
+    and an estimate of its memory footprint in sync.
+
+    Every appended record gets the next value of a per-session sequence
+    number starting at ``first_seq``, so clients can ask for "everything
+    after seq N" instead of re-reading the whole buffer.
+    """
+
+    __slots__ = ("_events", "stats", "nbytes", "last_seen", "next_seq")
+
+    def __init__(self, maxlen: Optional[int] = 1000, first_seq: int = 0) -> None:
+        self._events: Deque[EventRecord] = deque(maxlen=maxlen)
+        self.stats = SessionStats()
+        self.nbytes = 0
+        self.last_seen = 0.0
+        self.next_seq = first_seq
+
+    def append(self, record: EventRecord) -> None:
+        events = self._events
+        if events.maxlen is not None and len(events) == events.maxlen:
+            evicted = events[0]
+            self.stats.remove(evicted)
+            self.nbytes -= evicted.nbytes()
+        record.seq = self.next_seq
+        self.next_seq += 1
+        events.append(record)
+        self.stats.add(record)
+        self.nbytes += record.nbytes()
+
+    @property
+    def last_seq(self) -> int:
+        return self.next_seq - 1
+
+    @property
+    def first_seq(self) -> int:
+        """Seq of the oldest retained record (next_seq when empty)."""
+        return self._events[0].seq if self._events else self.next_seq
+
+    def newest(self, n: int) -> List[EventRecord]:
+        return list(islice(reversed(self._events), n))
+
+    def after(self, seq: int) -> List[EventRecord]:
+        """Records with a seq greater than ``seq``, newest first, in O(new records)."""
+        records = []
+        for record in reversed(self._events):
+            if record.seq <= seq:
+                break
+            records.append(record)
+        return records
+
+    def __iter__(self) -> Iterator[EventRecord]:
+        return iter(self._events)
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+
+VERDICTS = ("Safe", "Risk", "Caution")
+
+
+class GlobalStats:
+    """
+    Cross-session aggregate of every event ever accepted, in constant memory.
+
+    - exact per-verdict totals;
+    - per-verdict rates over the last ``window_seconds``, from a ring of
+      one-second buckets indexed by the events' server timestamp (events
+      replayed from an old log simply fall outside the window);
+    - HyperLogLog estimates of distinct domains, overall and per verdict;
+    - a SpaceSaving sketch of the most frequent Risk domains.
+
+    Memory depends only on ``window_seconds``, the HLL precision and
+    ``top_capacity``, never on traffic volume. ``observe`` takes one lock per
+    batch; the event log calls it from its writer thread, off the request path.
+    """
+
+    def __init__(self, window_seconds: int = 60, top_capacity: int = 200, hll_precision: int = 14) -> None:
+        self.window_seconds = window_seconds
+        self.totals: Dict[str, int] = {verdict: 0 for verdict in VERDICTS}
+        self.total = 0
+        self._buckets: List[Dict[str, int]] = [{} for _ in range(window_seconds)]
+        self._bucket_second: List[int] = [-1] * window_seconds
+        self.unique_domains = HyperLogLog(hll_precision)
+        self.unique_by_verdict = {verdict: HyperLogLog(hll_precision) for verdict in VERDICTS}
+        self.top_risky = SpaceSaving(top_capacity)
+        self._lock = threading.Lock()
+
+    def observe(self, events: Iterable[Event]) -> None:
+        with self._lock:
+            for event in events:
+                verdict = event.get("verdict") or "Caution"
+                domain = event.get("domain")
+                self.total += 1
+                self.totals[verdict] = self.totals.get(verdict, 0) + 1
+
+                second = int(numeric_timestamp(event.get("server_timestamp")))
+                slot = second % self.window_seconds
+                if self._bucket_second[slot] != second:
+                    if self._bucket_second[slot] > second:
+                        second = -1  # older than what the slot already holds: outside the window
+                    else:
+                        self._bucket_second[slot] = second
+                        self._buckets[slot] = {}
+                if second >= 0:
+                    bucket = self._buckets[slot]
+                    bucket[verdict] = bucket.get(verdict, 0) + 1
+
+                if domain:
+                    h = hash_value(domain)
+                    self.unique_domains.add_hash(h)
+                    hll = self.unique_by_verdict.get(verdict)
+                    if hll is not None:
+                        hll.add_hash(h)
+                    if verdict == "Risk":
+                        self.top_risky.add(domain)
+
+    def as_dict(self, top: int = 20, now: Optional[float] = None) -> Dict[str, Any]:
+        now_second = int(now if now is not None else time.time())
+        oldest = now_second - self.window_seconds
+        with self._lock:
+            window: Dict[str, int] = {verdict: 0 for verdict in VERDICTS}
+            for second, bucket in zip(self._bucket_second, self._buckets):
+                if oldest < second <= now_second:
+                    for verdict, count in bucket.items():
+                        window[verdict] = window.get(verdict, 0) + count
+            return {
+                "total_events": self.total,
+                "verdicts": {
+                    verdict: {"count": count, "per_second": round(window.get(verdict, 0) / self.window_seconds, 3)}
+                    for verdict, count in self.totals.items()
+                },
+                "window_seconds": self.window_seconds,
+                "unique_domains": self.unique_domains.count(),
+                "unique_domains_by_verdict": {v: hll.count() for v, hll in self.unique_by_verdict.items()},
+                "top_risky_domains": [
+                    {"domain": domain, "count": count, "max_overcount": error}
+                    for domain, count, error in self.top_risky.top(top)
+                ],
+            }
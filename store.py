@@ -0,0 +1,505 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from stats import EventRecord, SessionEvents, SessionStats, event_timestamp
+
+Event = Dict[str, Any]
+
+DEFAULT_MAX_EVENTS = 1000
+DEFAULT_SESSION_TTL = 30 * 60.0
+DEFAULT_MAX_SESSIONS = 10000
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+DEFAULT_SHARDS = 16
+
+# (events newest first, last_seq, truncated)
+Delta = Tuple[List[Event], int, bool]
+
+
+def _initial_seq() -> int:
+    """
+    First seq of a newly created session: the current time in microseconds.
+
+    Seqs are only compared within a session, but a session id can come back
+    after it was evicted; starting from the clock keeps its seqs above any
+    cursor a client still holds from the previous incarnation.
+    """
+    return time.time_ns() // 1000
+
+
+class EventStore:
+    """
+    Interface behind the /api routes.
+
+    A backend keeps at most ``max_events`` events per session (oldest dropped
+    first) and maintains the session stats alongside them, so reads never
+    have to rescan the events. Sessions that receive no events for longer
+    than ``session_ttl`` seconds are dropped, and at most ``max_sessions`` are kept (least
+    recently used first out).
+    """
+
+    def __init__(
+        self,
+        max_events: int = DEFAULT_MAX_EVENTS,
+        session_ttl: float = DEFAULT_SESSION_TTL,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+    ) -> None:
+        self.max_events = max_events
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+
+    def append(self, session_id: str, events: List[Event]) -> None:
+        """Store already-classified events for a session, in order."""
+        raise NotImplementedError
+
+    def recent(self, session_id: str, n: int) -> List[Event]:
+        """Return up to ``n`` most recent events, newest first."""
+        raise NotImplementedError
+
+    def events_since(self, session_id: str, seq: int) -> Delta:
+        """
+        Return the retained events with a seq greater than ``seq``.
+
+        ``truncated`` is set when the cursor is not contiguous with what is
+        retained (events were dropped in between, or the cursor is from an
+        evicted incarnation of the session); the caller then gets every
+        retained event and should replace its view rather than merge.
+        """
+        raise NotImplementedError
+
+    def last_seq(self, session_id: str) -> int:
+        """Seq of the newest event of the session, -1 if it has none."""
+        raise NotImplementedError
+
+    def stats(self, session_id: str) -> Dict[str, Any]:
+        """Return the /api/session-stats payload for a session."""
+        raise NotImplementedError
+
+
+class _Shard:
+    """One lock and the LRU-ordered sessions that hash to it."""
+
+    __slots__ = ("lock", "sessions", "nbytes")
+
+    def __init__(self, lock: Any) -> None:
+        self.lock = lock
+        self.sessions: "OrderedDict[str, SessionEvents]" = OrderedDict()
+        self.nbytes = 0
+
+
+class MemoryEventStore(EventStore):
+    """
+    Process-local store; only consistent with a single gunicorn worker.
+
+    Events are kept as compact EventRecords. Sessions are spread over
+    ``shards`` independently locked shards by hash of the session id, so
+    requests for unrelated sessions do not serialize on one mutex; every
+    critical section is a few dict/deque operations, with record building
+    and dict serialization done outside it. Within a shard, sessions sit in
+    an OrderedDict in least-recently-used order, so TTL expiry, the session
+    cap and the ``memory_budget`` (estimated bytes, split evenly across
+    shards like ``max_sessions``) are enforced by popping from the front
+    after each append. ``lock_factory`` builds the shard locks, e.g. a
+    metrics.TimedLock to measure contention.
+    """
+
+    def __init__(
+        self,
+        max_events: int = DEFAULT_MAX_EVENTS,
+        session_ttl: float = DEFAULT_SESSION_TTL,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        memory_budget: int = DEFAULT_MEMORY_BUDGET,
+        shards: int = DEFAULT_SHARDS,
+        lock_factory: Callable[[], Any] = threading.Lock,
+    ) -> None:
+        super().__init__(max_events, session_ttl, max_sessions)
+        self.memory_budget = memory_budget
+        self.shards = [_Shard(lock_factory()) for _ in range(max(1, shards))]
+        self._shard_max_sessions = max(1, -(-max_sessions // len(self.shards)))
+        self._shard_memory_budget = memory_budget // len(self.shards)
+
+    def _shard(self, session_id: str) -> _Shard:
+        return self.shards[hash(session_id) % len(self.shards)]
+
+    @property
+    def session_count(self) -> int:
+        return sum(len(shard.sessions) for shard in self.shards)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(shard.nbytes for shard in self.shards)
+
+    def _session(self, shard: _Shard, session_id: str, now: float, create: bool) -> Optional[SessionEvents]:
+        session = shard.sessions.get(session_id)
+        if session is not None and now - session.last_seen > self.session_ttl:
+            del shard.sessions[session_id]
+            shard.nbytes -= session.nbytes
+            session = None
+        if not create:
+            return session
+        if session is None:
+            session = SessionEvents(maxlen=self.max_events, first_seq=_initial_seq())
+            shard.sessions[session_id] = session
+        else:
+            shard.sessions.move_to_end(session_id)
+        session.last_seen = now
+        return session
+
+    def _evict(self, shard: _Shard, now: float) -> None:
+        sessions = shard.sessions
+        # Never evict the most recently used session, even if it alone is over budget.
+        while len(sessions) > 1:
+            session_id, oldest = next(iter(sessions.items()))
+            if (
+                now - oldest.last_seen <= self.session_ttl
+                and len(sessions) <= self._shard_max_sessions
+                and shard.nbytes <= self._shard_memory_budget
+            ):
+                break
+            del sessions[session_id]
+            shard.nbytes -= oldest.nbytes
+
+    def append(self, session_id: str, events: List[Event]) -> None:
+        # Events of an oversized batch that would be evicted by the same batch
+        # only consume their seqs; no record is built for them.
+        skipped = max(0, len(events) - self.max_events)
+        records = [EventRecord(event) for event in events[skipped:]]
+        now = time.monotonic()
+        shard = self._shard(session_id)
+        with shard.lock:
+            session = self._session(shard, session_id, now, create=True)
+            before = session.nbytes
+            session.next_seq += skipped
+            for record in records:
+                session.append(record)
+            shard.nbytes += session.nbytes - before
+            self._evict(shard, now)
+
+    def recent(self, session_id: str, n: int) -> List[Event]:
+        shard = self._shard(session_id)
+        with shard.lock:
+            session = self._session(shard, session_id, time.monotonic(), create=False)
+            if session is None:
+                return []
+            records = session.newest(n)
+        return [record.to_dict(session_id) for record in records]
+
+    def events_since(self, session_id: str, seq: int) -> Delta:
+        shard = self._shard(session_id)
+        with shard.lock:
+            session = self._session(shard, session_id, time.monotonic(), create=False)
+            if session is None:
+                return [], -1, seq >= 0
+            last_seq = session.last_seq
+            truncated = seq < session.first_seq - 1 or seq > last_seq
+            records = session.after(-1 if seq > last_seq else seq)
+        return [record.to_dict(session_id) for record in records], last_seq, truncated
+
+    def last_seq(self, session_id: str) -> int:
+        shard = self._shard(session_id)
+        with shard.lock:
+            session = self._session(shard, session_id, time.monotonic(), create=False)
+            return session.last_seq if session is not None else -1
+
+    def stats(self, session_id: str) -> Dict[str, Any]:
+        shard = self._shard(session_id)
+        with shard.lock:
+            session = self._session(shard, session_id, time.monotonic(), create=False)
+            if session is not None:
+                return session.stats.as_dict()
+        return SessionStats().as_dict()
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    next_seq INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    safe_count INTEGER NOT NULL DEFAULT 0,
+    risk_count INTEGER NOT NULL DEFAULT 0,
+    caution_count INTEGER NOT NULL DEFAULT 0,
+    unique_domains INTEGER NOT NULL DEFAULT 0,
+    last_seen REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS sessions_by_last_seen ON sessions (last_seen);
+CREATE TABLE IF NOT EXISTS events (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    timestamp REAL NOT NULL,
+    domain TEXT,
+    verdict TEXT,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS events_by_time ON events (session_id, timestamp);
+CREATE TABLE IF NOT EXISTS session_domains (
+    session_id TEXT NOT NULL,
+    domain TEXT NOT NULL,
+    refs INTEGER NOT NULL,
+    PRIMARY KEY (session_id, domain)
+) WITHOUT ROWID;
+"""
+
+class SQLiteEventStore(EventStore):
+    """
+    Store shared by every worker process on one host, backed by SQLite in WAL
+    mode.
+
+    WAL lets readers run concurrently with the single writer, and each append
+    is one short ``BEGIN IMMEDIATE`` transaction that inserts the batch, trims
+    the session back to ``max_events`` and applies the same counter deltas the
+    in-memory SessionStats does, so stats reads stay a single-row lookup.
+    Connections are opened lazily per thread and per process, which keeps
+    them safe across gunicorn's fork. Idle and over-cap sessions are swept
+    at most every ``sweep_interval`` seconds by whichever worker appends.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_events: int = DEFAULT_MAX_EVENTS,
+        session_ttl: float = DEFAULT_SESSION_TTL,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        sweep_interval: float = 60.0,
+    ) -> None:
+        super().__init__(max_events, session_ttl, max_sessions)
+        self.path = path
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0.0
+        self._local = threading.local()
+        self._connect().executescript(_SCHEMA)
+
+    @property
+    def session_count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def append(self, session_id: str, events: List[Event]) -> None:
+        if not events:
+            return
+        rows = []
+        verdicts: Counter = Counter()
+        domains: Counter = Counter()
+        for event in events:
+            domain = event.get("domain") or None
+            verdict = event.get("verdict")
+            verdicts[verdict] += 1
+            if domain:
+                domains[domain] += 1
+            payload = json.dumps(EventRecord(event).to_dict(session_id))
+            rows.append((event_timestamp(event), domain, verdict, payload))
+        # Only the newest max_events of an oversized batch would survive anyway.
+        if len(rows) > self.max_events:
+            dropped = rows[: len(rows) - self.max_events]
+            rows = rows[len(rows) - self.max_events :]
+            for _, domain, verdict, _ in dropped:
+                verdicts[verdict] -= 1
+                if domain:
+                    domains[domain] -= 1
+        skipped = len(events) - len(rows)
+        now = time.time()
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, next_seq) VALUES (?, ?)", (session_id, _initial_seq())
+            )
+            (next_seq,) = conn.execute(
+                "SELECT next_seq FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            first_seq = next_seq + skipped
+            conn.executemany(
+                "INSERT INTO events (session_id, seq, timestamp, domain, verdict, payload) VALUES (?, ?, ?, ?, ?, ?)",
+                [(session_id, first_seq + i) + row for i, row in enumerate(rows)],
+            )
+            next_seq = first_seq + len(rows)
+
+            cutoff = next_seq - self.max_events
+            for domain, verdict in conn.execute(
+                "SELECT domain, verdict FROM events WHERE session_id = ? AND seq < ?", (session_id, cutoff)
+            ).fetchall():
+                verdicts[verdict] -= 1
+                if domain:
+                    domains[domain] -= 1
+            conn.execute("DELETE FROM events WHERE session_id = ? AND seq < ?", (session_id, cutoff))
+
+            unique_delta = 0
+            for domain, delta in domains.items():
+                if delta > 0:
+                    cur = conn.execute(
+                        "UPDATE session_domains SET refs = refs + ? WHERE session_id = ? AND domain = ?",
+                        (delta, session_id, domain),
+                    )
+                    if cur.rowcount == 0:
+                        conn.execute(
+                            "INSERT INTO session_domains (session_id, domain, refs) VALUES (?, ?, ?)",
+                            (session_id, domain, delta),
+                        )
+                        unique_delta += 1
+                elif delta < 0:
+                    conn.execute(
+                        "UPDATE session_domains SET refs = refs + ? WHERE session_id = ? AND domain = ?",
+                        (delta, session_id, domain),
+                    )
+                    cur = conn.execute(
+                        "DELETE FROM session_domains WHERE session_id = ? AND domain = ? AND refs <= 0",
+                        (session_id, domain),
+                    )
+                    unique_delta -= cur.rowcount
+
+            kept = sum(verdicts.values())
+            conn.execute(
+                "UPDATE sessions SET next_seq = ?, total = total + ?, safe_count = safe_count + ?, "
+                "risk_count = risk_count + ?, caution_count = caution_count + ?, "
+                "unique_domains = unique_domains + ?, last_seen = ? WHERE session_id = ?",
+                (
+                    next_seq,
+                    kept,
+                    verdicts.get("Safe", 0),
+                    verdicts.get("Risk", 0),
+                    verdicts.get("Caution", 0),
+                    unique_delta,
+                    now,
+                    session_id,
+                ),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            self.sweep(now)
+
+    def sweep(self, now: Optional[float] = None) -> None:
+        """Drop sessions idle past the TTL and the least recently used ones over the cap."""
+        now = time.time() if now is None else now
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            expired = conn.execute(
+                "SELECT session_id FROM sessions WHERE last_seen < ? "
+                "UNION SELECT session_id FROM "
+                "(SELECT session_id FROM sessions ORDER BY last_seen DESC LIMIT -1 OFFSET ?)",
+                (now - self.session_ttl, self.max_sessions),
+            ).fetchall()
+            for table in ("events", "session_domains", "sessions"):
+                conn.executemany(f"DELETE FROM {table} WHERE session_id = ?", expired)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def recent(self, session_id: str, n: int) -> List[Event]:
+        rows = self._connect().execute(
+            "SELECT seq, payload FROM events WHERE session_id = ? ORDER BY seq DESC LIMIT ?", (session_id, n)
+        ).fetchall()
+        return [_decode(seq, payload) for seq, payload in rows]
+
+    def events_since(self, session_id: str, seq: int) -> Delta:
+        conn = self._connect()
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute(
+                "SELECT next_seq, (SELECT MIN(seq) FROM events WHERE session_id = ?) FROM sessions WHERE session_id = ?",
+                (session_id, session_id),
+            ).fetchone()
+            if row is None:
+                return [], -1, seq >= 0
+            next_seq, first_seq = row
+            last_seq = next_seq - 1
+            first_seq = next_seq if first_seq is None else first_seq
+            truncated = seq < first_seq - 1 or seq > last_seq
+            rows = conn.execute(
+                "SELECT seq, payload FROM events WHERE session_id = ? AND seq > ? ORDER BY seq DESC",
+                (session_id, -1 if seq > last_seq else seq),
+            ).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        return [_decode(s, payload) for s, payload in rows], last_seq, truncated
+
+    def last_seq(self, session_id: str) -> int:
+        row = self._connect().execute(
+            "SELECT next_seq - 1 FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0] if row is not None else -1
+
+    def stats(self, session_id: str) -> Dict[str, Any]:
+        conn = self._connect()
+        # One read transaction so the counters and the max come from the same snapshot.
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute(
+                "SELECT total, safe_count, risk_count, caution_count, unique_domains FROM sessions WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+            (last_activity,) = conn.execute(
+                "SELECT MAX(timestamp) FROM events WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        finally:
+            conn.execute("COMMIT")
+        if row is None:
+            return SessionStats().as_dict()
+        total, safe, risk, caution, unique = row
+        return {
+            "total_requests": total,
+            "safe_count": safe,
+            "risk_count": risk,
+            "caution_count": caution,
+            "unique_domains": unique,
+            "last_activity": last_activity or 0,
+        }
+
+
+def _decode(seq: int, payload: str) -> Event:
+    event = json.loads(payload)
+    event["seq"] = seq
+    return event
+
+
+def create_store(
+    kind: Optional[str] = None, path: Optional[str] = None, lock_factory: Callable[[], Any] = threading.Lock
+) -> EventStore:
+    """
+    Build the event store selected by ``EVENT_STORE`` ("memory" or "sqlite").
+
+    The SQLite file defaults to ``EVENT_STORE_PATH`` or a file in the system
+    temp directory, so every worker started from the same environment shares
+    it. SESSION_TTL_SECONDS, MAX_SESSIONS and (memory only) MEMORY_BUDGET_MB
+    bound what is retained. ``lock_factory`` builds the memory store's shard
+    locks.
+    """
+    kind = (kind or os.environ.get("EVENT_STORE", "memory")).lower()
+    limits = {
+        "session_ttl": float(os.environ.get("SESSION_TTL_SECONDS", DEFAULT_SESSION_TTL)),
+        "max_sessions": int(os.environ.get("MAX_SESSIONS", DEFAULT_MAX_SESSIONS)),
+    }
+    if kind == "memory":
+        budget_mb = float(os.environ.get("MEMORY_BUDGET_MB", DEFAULT_MEMORY_BUDGET / (1024 * 1024)))
+        shards = int(os.environ.get("EVENT_STORE_SHARDS", DEFAULT_SHARDS))
+        return MemoryEventStore(
+            memory_budget=int(budget_mb * 1024 * 1024), shards=shards, lock_factory=lock_factory, **limits
+        )
+    if kind == "sqlite":
+        path = path or os.environ.get("EVENT_STORE_PATH") or os.path.join(
+            tempfile.gettempdir(), "privacy-scanner-events.db"
+        )
+        return SQLiteEventStore(path, **limits)
+    raise ValueError(f"Unknown EVENT_STORE backend: {kind!r}")
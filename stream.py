@@ -0,0 +1,115 @@
+import json
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+from store import EventStore
+
+
+def format_sse(data: Any, event: Optional[str] = None, event_id: Optional[int] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+class SessionNotifier:
+    """
+    Wakes stream generators when their session receives events.
+
+    Only sessions with a subscribed stream get a version counter, so ingest
+    for sessions nobody is watching costs one dict lookup.
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._versions: Dict[str, int] = {}
+        self._subscribers: Dict[str, int] = {}
+
+    def subscribe(self, session_id: str) -> int:
+        with self._cond:
+            self._subscribers[session_id] = self._subscribers.get(session_id, 0) + 1
+            return self._versions.setdefault(session_id, 0)
+
+    def unsubscribe(self, session_id: str) -> None:
+        with self._cond:
+            remaining = self._subscribers.get(session_id, 0) - 1
+            if remaining > 0:
+                self._subscribers[session_id] = remaining
+            else:
+                self._subscribers.pop(session_id, None)
+                self._versions.pop(session_id, None)
+
+    def notify(self, session_id: str) -> None:
+        if session_id not in self._subscribers:
+            return
+        with self._cond:
+            if session_id in self._subscribers:
+                self._versions[session_id] += 1
+                self._cond.notify_all()
+
+    def wait(self, session_id: str, version: int, timeout: float) -> int:
+        """Block until the session's version moves past ``version`` or ``timeout`` elapses."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._versions.get(session_id, 0) != version, timeout)
+            return self._versions.get(session_id, 0)
+
+
+def event_stream(
+    store: EventStore,
+    notifier: SessionNotifier,
+    session_id: str,
+    cursor: int,
+    poll_interval: float = 1.0,
+    keepalive_interval: float = 15.0,
+    max_duration: float = 300.0,
+) -> Iterator[str]:
+    """
+    Server-Sent Events for one session: "events" messages carrying the new
+    events since ``cursor`` (the message id is the new cursor, so a browser
+    reconnecting with Last-Event-ID resumes where it left off) and "stats"
+    messages carrying only the stats fields that changed.
+
+    The generator pulls from the store by cursor rather than having events
+    pushed into a per-connection queue, so a slow client never makes the
+    server buffer more than the store already retains: it simply receives
+    larger batches, or a ``truncated`` batch if it fell behind retention.
+    Local ingest wakes it immediately through ``notifier``; writes made by
+    other workers (shared store) are picked up by a cheap last_seq check
+    every ``poll_interval``. The stream ends after ``max_duration`` so
+    worker threads are recycled; EventSource reconnects on its own.
+    """
+    sent_stats: Dict[str, Any] = {}
+    version = notifier.subscribe(session_id)
+    try:
+        last_seq = None
+        deadline = time.monotonic() + max_duration
+        last_write = time.monotonic()
+        yield "retry: 2000\n\n"
+        while time.monotonic() < deadline:
+            current = store.last_seq(session_id)
+            if current != last_seq:
+                events, last_seq, truncated = store.events_since(session_id, cursor)
+                if events or truncated:
+                    cursor = last_seq
+                    yield format_sse(
+                        {"events": events, "count": len(events), "last_seq": last_seq, "truncated": truncated},
+                        event="events",
+                        event_id=last_seq,
+                    )
+                    last_write = time.monotonic()
+                stats = store.stats(session_id)
+                delta = {k: v for k, v in stats.items() if sent_stats.get(k) != v}
+                if delta:
+                    sent_stats.update(delta)
+                    yield format_sse(delta, event="stats")
+                    last_write = time.monotonic()
+            if time.monotonic() - last_write >= keepalive_interval:
+                yield ": keepalive\n\n"
+                last_write = time.monotonic()
+            version = notifier.wait(session_id, version, poll_interval)
+    finally:
+        notifier.unsubscribe(session_id)